@@ -0,0 +1,93 @@
+import csv
+import io
+import os
+import zipfile
+
+from output_writer import NomsUniques
+
+
+MANIFESTE = "manifest.csv"
+
+# Entete locale + repertoire central d'un membre (hors nom), pour estimer la taille
+_SURCOUT_MEMBRE = 30 + 46
+
+
+class ArchiveFactures:
+    """
+    Ecrit les factures d'un lot directement dans une archive ZIP, sans fichier
+    intermediaire : ecriture sequentielle, membres stockes sans recompression
+    (un .docx est deja compresse).
+
+    Avec `taille_max` (octets), l'archive est decoupee en parties
+    `<nom>_001.zip`, `<nom>_002.zip`... ; une partie est close avant de depasser
+    la limite (sauf facture seule plus grosse que la limite). La derniere partie
+    contient `manifest.csv` : position -> partie, entree (ou erreur). La
+    position est fournie par l'appelant : "Ligne 5" (ligne Excel), ou
+    "Ligne 12 (classeur.xlsx / Feuille)" pour un lot multi-sources.
+    """
+
+    def __init__(self, chemin, taille_max=None):
+        self.chemin = chemin
+        self.taille_max = taille_max
+        self.parties = []
+        self.manifeste = []
+        self.noms = NomsUniques()
+        self.zip = None
+        self.taille = 0
+
+    def _nom_partie(self):
+        if not self.taille_max:
+            return self.chemin
+        base, ext = os.path.splitext(self.chemin)
+        return f"{base}_{len(self.parties) + 1:03d}{ext or '.zip'}"
+
+    def _ouvrir_partie(self):
+        if self.zip is not None:
+            self.zip.close()
+        chemin = self._nom_partie()
+        dossier = os.path.dirname(chemin)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        self.zip = zipfile.ZipFile(chemin, "w", compression=zipfile.ZIP_STORED)
+        self.parties.append(chemin)
+        self.taille = 22
+
+    def ajouter(self, position, nom, contenu):
+        """Ajoute une facture ; `position` identifie sa ligne d'origine dans le manifeste."""
+        nom = self.noms.reserver(nom)
+        taille = len(contenu) + 2 * len(nom.encode("utf-8")) + _SURCOUT_MEMBRE
+        if self.zip is None or (
+            self.taille_max and self.zip.filelist and self.taille + taille > self.taille_max
+        ):
+            self._ouvrir_partie()
+        self.zip.writestr(nom, contenu)
+        self.taille += taille
+        self.manifeste.append((position, os.path.basename(self.parties[-1]), nom, ""))
+        return nom
+
+    def noter_erreur(self, position, erreur):
+        self.manifeste.append((position, "", "", erreur))
+
+    def fermer(self):
+        """Ecrit le manifeste dans la derniere partie et ferme l'archive."""
+        if self.zip is None:
+            self._ouvrir_partie()
+        tampon = io.StringIO()
+        writer = csv.writer(tampon, delimiter=";")
+        writer.writerow(["position", "archive", "entree", "erreur"])
+        writer.writerows(self.manifeste)
+        self.zip.writestr(MANIFESTE, tampon.getvalue().encode("utf-8-sig"), compress_type=zipfile.ZIP_DEFLATED)
+        self.zip.close()
+        self.zip = None
+        return self.parties
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.fermer()
+        elif self.zip is not None:
+            self.zip.close()
+            self.zip = None
+        return False
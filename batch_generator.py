@@ -0,0 +1,199 @@
+import itertools
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+from generate_facture import generer_facture, generer_facture_octets, nom_facture
+from output_writer import EcrivainSorties, NomsUniques, chemin_temporaire
+from pipe_process import ProcessusPipe
+
+
+def _worker_main(conn, dossier_sortie, niveau_compression=None, fsync_tous=0):
+    """Boucle d'un processus de rendu : recoit (index, data, nom), renvoie le resultat."""
+    ecrivain = EcrivainSorties(dossier_sortie, fsync_tous) if dossier_sortie is not None else None
+    try:
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                break
+            if task is None:
+                break
+            index, data, nom = task
+            debut = time.perf_counter()
+            chemin = contenu = erreur = None
+            try:
+                if ecrivain is None:
+                    contenu = generer_facture_octets(data, niveau_compression)[1]
+                else:
+                    chemin = generer_facture(data, dossier_sortie, niveau_compression, nom, ecrivain)
+            except Exception as exc:
+                erreur = f"{type(exc).__name__}: {exc}"
+            conn.send((index, chemin, contenu, erreur, time.perf_counter() - debut))
+    finally:
+        if ecrivain is not None:
+            ecrivain.fermer()
+
+
+class _Worker(ProcessusPipe):
+    def __init__(self, ctx, dossier_sortie, niveau_compression=None, fsync_tous=0):
+        super().__init__(ctx, _worker_main, dossier_sortie, niveau_compression, fsync_tous)
+        self.task = None
+        self.debut = None
+        self.deadline = None
+
+    def submit(self, index, data, nom, timeout):
+        self.conn.send((index, data, nom))
+        self.task = (index, data, nom)
+        self.debut = time.monotonic()
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+
+def _arreter(worker, dossier_sortie):
+    """
+    Arrete un processus de rendu ; s'il avait une facture en cours, il est tue
+    et son fichier temporaire supprime (le fichier final n'a pas ete touche).
+    """
+    if worker.task is None:
+        worker.stop()
+        return
+    nom = worker.task[2]
+    worker.stop(force=True)
+    if dossier_sortie is not None:
+        try:
+            os.remove(chemin_temporaire(dossier_sortie, nom, worker.process.pid))
+        except OSError:
+            pass
+
+
+def _resultat(index, data, nom=None, chemin=None, erreur=None, duree=0.0, contenu=None, ignore=False):
+    return {
+        "index": index, "data": data, "chemin": chemin, "nom": nom,
+        "contenu": contenu, "erreur": erreur, "duree": duree, "ignore": ignore,
+    }
+
+
+def position_resultat(resultat):
+    """Ligne du fichier d'un resultat (`_ligne` de l'enregistrement), suivie de sa source en multi-sources."""
+    data = resultat["data"]
+    ligne = data.get("_ligne", resultat["index"] + 2)
+    source = data.get("source")
+    return f"Ligne {ligne} ({source})" if source else f"Ligne {ligne}"
+
+
+def iterer_lot(
+    records, dossier_sortie, workers=None, timeout=None, annulation=None, niveau_compression=None, ignorer=None,
+    depart=0, fsync_tous=0,
+):
+    """
+    Genere les factures de `records` dans un pool de processus et renvoie les
+    resultats au fil de l'eau, dans l'ordre d'entree.
+
+    Chaque resultat est un dict : index, data, chemin, nom, contenu, erreur, duree,
+    ignore. Les noms de fichiers sont reserves ici, dans l'ordre des lignes : deux
+    lignes de meme reference donnent Facture_X.docx et Facture_X_2.docx, quel que
+    soit l'ordre de fin des processus. Les fichiers sont ecrits de facon atomique ;
+    `fsync_tous` regle la synchronisation disque (voir EcrivainSorties).
+
+    Les lignes refusees par le controle du chargement (champ `rejet`) ne sont pas
+    rendues : resultat en erreur "Rejetee : <motif>".
+    Les lignes pour lesquelles `ignorer(data, nom)` est vrai ne sont pas rendues
+    (resultat avec ignore=True), sans decaler les index. Avec `depart`, les
+    premieres lignes sont sautees (reprise d'un lot) et les index restent ceux
+    du fichier.
+    Si `dossier_sortie` est None, aucun fichier n'est ecrit : `nom` et `contenu`
+    (octets du .docx) sont renvoyes au processus principal. Une facture
+    qui depasse `timeout` secondes est annulee (processus remplace) et remontee en
+    erreur. Si `annulation` (threading.Event ou equivalent) est positionne, plus
+    aucune facture n'est lancee et le lot s'arrete apres les factures en cours.
+    `niveau_compression` (0-9) s'applique aux parties recompressees de chaque .docx.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    ctx = multiprocessing.get_context()
+    pool = [_Worker(ctx, dossier_sortie, niveau_compression, fsync_tous) for _ in range(workers)]
+    # Fenetre de lancement bornee : une facture lente ne fait pas grossir le tampon indefiniment
+    fenetre = workers * 4
+    noms = NomsUniques()
+    source = enumerate(records)
+    # Lignes deja traitees (reprise) : leurs noms restent reserves pour garder les memes suffixes
+    for _, data in itertools.islice(source, depart):
+        noms.reserver(nom_facture(data))
+    epuise = False
+    termines = {}
+    prochain = depart
+    lances = depart
+
+    try:
+        while True:
+            if annulation is not None and annulation.is_set():
+                epuise = True
+            for worker in pool:
+                while not epuise and worker.task is None and lances < prochain + fenetre:
+                    try:
+                        index, data = next(source)
+                    except StopIteration:
+                        epuise = True
+                        break
+                    lances += 1
+                    nom = noms.reserver(nom_facture(data))
+                    rejet = data.get("rejet")
+                    if rejet:
+                        termines[index] = _resultat(index, data, nom, erreur=f"Rejetee : {rejet['motif']}")
+                        continue
+                    if ignorer is not None and ignorer(data, nom):
+                        termines[index] = _resultat(index, data, nom, ignore=True)
+                        continue
+                    worker.submit(index, data, nom, timeout)
+
+            while prochain in termines:
+                yield termines.pop(prochain)
+                prochain += 1
+
+            occupes = [w for w in pool if w.task is not None]
+            if not occupes:
+                if epuise:
+                    break
+                continue
+
+            deadlines = [w.deadline for w in occupes if w.deadline is not None]
+            attente = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            if annulation is not None:
+                # Reveil regulier pour prendre en compte une annulation
+                attente = 0.2 if attente is None else min(attente, 0.2)
+            prets = wait([w.conn for w in occupes], timeout=attente)
+
+            for i, worker in enumerate(pool):
+                if worker.task is None:
+                    continue
+                index, data, nom = worker.task
+                if worker.conn in prets:
+                    try:
+                        _, chemin, contenu, erreur, duree = worker.conn.recv()
+                        termines[index] = _resultat(index, data, nom, chemin, erreur, duree, contenu)
+                        worker.task = None
+                        continue
+                    except EOFError:
+                        erreur = "Processus de rendu interrompu"
+                elif worker.deadline is not None and time.monotonic() >= worker.deadline:
+                    erreur = f"Delai depasse ({timeout} s)"
+                else:
+                    continue
+                termines[index] = _resultat(index, data, nom, erreur=erreur, duree=time.monotonic() - worker.debut)
+                _arreter(worker, dossier_sortie)
+                pool[i] = _Worker(ctx, dossier_sortie, niveau_compression, fsync_tous)
+    finally:
+        # Annulation, Ctrl+C, erreur de lecture : les factures en cours sont abandonnees
+        for worker in pool:
+            _arreter(worker, dossier_sortie)
+
+
+def generer_lot(
+    records, dossier_sortie, workers=None, timeout=None, annulation=None, niveau_compression=None, ignorer=None,
+    depart=0, fsync_tous=0,
+):
+    """Version liste de `iterer_lot` : tous les resultats, dans l'ordre d'entree."""
+    return list(iterer_lot(
+        records, dossier_sortie, workers=workers, timeout=timeout, annulation=annulation,
+        niveau_compression=niveau_compression, ignorer=ignorer, depart=depart, fsync_tous=fsync_tous,
+    ))
@@ -0,0 +1,253 @@
+"""
+Mesure de performance de la chaine de generation, etape par etape, sur un
+classeur synthetique (voir workbook_generator.py).
+
+Etapes chronometrees (mediane de --repetitions passages) :
+    lecture_excel   lecture brute des cellules (openpyxl read-only)
+    chargement      charger_donnees_excel complet (lecture + conversion + mapping)
+    mapping         conversion + mapping seuls, sur les lignes de la feuille des
+                    factures deja lues en memoire (sans jointure de la feuille Lignes)
+    template        compilation du template Word (sans cache)
+    rendu           remplissage du template, --rendus factures
+    enregistrement  serialisation .docx en memoire des factures rendues
+    historique      ecriture SQLite de l'historique pour toutes les factures
+
+Exemples :
+    python benchmarks/run_benchmarks.py --factures 10000 -o resultats.json
+    python benchmarks/run_benchmarks.py --factures 10000 --reference benchmarks/reference.json
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from importlib import metadata
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+import openpyxl  # noqa: E402
+
+import generate_facture  # noqa: E402
+from docx_writer import enregistrer_docx  # noqa: E402
+from excel_loader import _detecter_csv, _feuilles, _records, charger_donnees_excel, est_csv  # noqa: E402
+from history_store import SqliteHistoryStore  # noqa: E402
+from workbook_generator import FORMATS, generer_classeur  # noqa: E402
+
+
+VERSION_RESULTATS = 1
+FACTURES_MIN = 100
+FACTURES_MAX = 100000
+ETAPES = ("lecture_excel", "chargement", "mapping", "template", "rendu", "enregistrement", "historique")
+PAQUETS = ("docxtpl", "python-docx", "openpyxl", "pandas", "numpy")
+
+
+def _chrono(fonction, repetitions):
+    durees = []
+    resultat = None
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        durees.append(time.perf_counter() - debut)
+    return durees, resultat
+
+
+def _lecture_brute(fichier):
+    if est_csv(fichier):
+        encodage, _ = _detecter_csv(fichier)
+        with open(fichier, "r", encoding=encodage, newline="") as f:
+            return sum(1 for _ in f)
+    wb = openpyxl.load_workbook(fichier, read_only=True, data_only=True)
+    try:
+        return sum(1 for ws in wb.worksheets for _ in ws.iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def _lignes_factures(fichier):
+    """Lignes brutes (entete compris) de la feuille des factures, lues une fois pour mesurer le mapping seul."""
+    if est_csv(fichier):
+        encodage, separateur = _detecter_csv(fichier)
+        with open(fichier, "r", encoding=encodage, newline="") as f:
+            return list(csv.reader(f, delimiter=separateur))
+    wb = openpyxl.load_workbook(fichier, read_only=True, data_only=True)
+    try:
+        return list(_feuilles(wb)[0].iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def _historique(records, dossier):
+    store = SqliteHistoryStore(os.path.join(dossier, f"history_{time.perf_counter_ns()}.sqlite3"))
+    maintenant = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with store.batch():
+        for data in records:
+            store.add({"datetime": maintenant, "file": generate_facture.nom_facture(data), "meta": data})
+    store.conn.close()
+
+
+def mesurer(fichier, rendus=200, repetitions=3, template_path=None):
+    """Durees de chaque etape : {etape: {"secondes": mediane, "mesures": [...], "unites": n}}."""
+    template_path = template_path or os.path.join(RACINE, generate_facture.TEMPLATE_PATH)
+    etapes = {}
+
+    def noter(nom, durees, unites):
+        etapes[nom] = {"secondes": statistics.median(durees), "mesures": durees, "unites": unites}
+
+    durees, nb_lignes = _chrono(lambda: _lecture_brute(fichier), repetitions)
+    noter("lecture_excel", durees, nb_lignes)
+    durees, records = _chrono(lambda: list(charger_donnees_excel(fichier, streaming=True)), repetitions)
+    noter("chargement", durees, len(records))
+    lignes = _lignes_factures(fichier)
+    durees, mappes = _chrono(lambda: sum(1 for _ in _records(iter(lignes))), repetitions)
+    noter("mapping", durees, mappes)
+    del lignes
+
+    def compiler():
+        generate_facture._template_cache.clear()
+        return generate_facture.charger_template(template_path)
+
+    durees, template = _chrono(compiler, repetitions)
+    noter("template", durees, 1)
+
+    echantillon = [data for data in records if not data.get("rejet")][:rendus]
+
+    def rendre():
+        documents = []
+        for data in echantillon:
+            doc = template.new_document(rapide=generate_facture.RENDU_RAPIDE)
+            doc.render(template.build_context(data))
+            documents.append(doc)
+        return documents
+
+    durees, documents = _chrono(rendre, repetitions)
+    noter("rendu", durees, len(echantillon))
+
+    def enregistrer():
+        taille = 0
+        for doc in documents:
+            tampon = io.BytesIO()
+            enregistrer_docx(doc, tampon, template.pieces)
+            taille += tampon.tell()
+        return taille
+
+    durees, _ = _chrono(enregistrer, repetitions)
+    noter("enregistrement", durees, len(documents))
+
+    with tempfile.TemporaryDirectory() as dossier:
+        durees, _ = _chrono(lambda: _historique(records, dossier), repetitions)
+    noter("historique", durees, len(records))
+    return etapes
+
+
+def _versions():
+    versions = {}
+    for paquet in PAQUETS:
+        try:
+            versions[paquet] = metadata.version(paquet)
+        except metadata.PackageNotFoundError:
+            versions[paquet] = None
+    return versions
+
+
+def comparer(resultats, reference, seuil):
+    """Lignes de comparaison (etape, reference, mesure, ecart) et liste des regressions au-dela de `seuil`."""
+    lignes = []
+    regressions = []
+    for etape in ETAPES:
+        actuel = resultats["etapes"].get(etape)
+        ancien = reference.get("etapes", {}).get(etape)
+        if actuel is None or ancien is None or not ancien["secondes"]:
+            continue
+        ecart = actuel["secondes"] / ancien["secondes"] - 1
+        lignes.append((etape, ancien["secondes"], actuel["secondes"], ecart))
+        if ecart > seuil:
+            regressions.append(etape)
+    return lignes, regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la generation de factures, etape par etape.")
+    parser.add_argument("--factures", type=int, default=1000, help=f"Factures du classeur ({FACTURES_MIN} a {FACTURES_MAX})")
+    parser.add_argument("--lignes-par-facture", type=int, default=3, help="Lignes de prestation par facture (defaut : 3)")
+    parser.add_argument("--format", choices=FORMATS, default="large", help="Format du fichier d'entree (defaut : large)")
+    parser.add_argument("--graine", type=int, default=42, help="Graine du classeur synthetique (defaut : 42)")
+    parser.add_argument("--rendus", type=int, default=200, help="Factures rendues et enregistrees par passage (defaut : 200)")
+    parser.add_argument("--repetitions", type=int, default=3, help="Passages par etape, la mediane est retenue (defaut : 3)")
+    parser.add_argument("--entree", help="Classeur existant a mesurer au lieu du classeur synthetique")
+    parser.add_argument("-o", "--sortie", help="Fichier JSON des resultats (defaut : affichage seul)")
+    parser.add_argument("--reference", help="Resultats de reference (JSON) a comparer")
+    parser.add_argument(
+        "--seuil", type=float, default=0.20,
+        help="Ralentissement tolere par etape avant d'echouer, en fraction (defaut : 0.20 = +20 %%)",
+    )
+    args = parser.parse_args(argv)
+    if not args.entree and not FACTURES_MIN <= args.factures <= FACTURES_MAX:
+        parser.error(f"--factures : entre {FACTURES_MIN} et {FACTURES_MAX}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    parametres = {
+        "factures": args.factures, "lignes_par_facture": args.lignes_par_facture, "format": args.format,
+        "graine": args.graine, "rendus": args.rendus, "repetitions": args.repetitions, "entree": args.entree,
+        "rendu_rapide": generate_facture.RENDU_RAPIDE,
+    }
+    with tempfile.TemporaryDirectory() as dossier:
+        fichier = args.entree
+        if fichier is None:
+            extension = ".csv" if args.format == "csv" else ".xlsx"
+            fichier = generer_classeur(
+                os.path.join(dossier, f"bench{extension}"), args.factures, args.lignes_par_facture, args.format, args.graine
+            )
+        etapes = mesurer(fichier, args.rendus, args.repetitions)
+
+    resultats = {
+        "version": VERSION_RESULTATS,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "plateforme": platform.platform(),
+            "processeur": platform.processor() or platform.machine(),
+            "coeurs": os.cpu_count(),
+            "python": platform.python_version(),
+            "paquets": _versions(),
+        },
+        "parametres": parametres,
+        "etapes": etapes,
+    }
+
+    for etape in ETAPES:
+        mesure = etapes[etape]
+        par_unite = mesure["secondes"] / mesure["unites"] * 1000 if mesure["unites"] else 0.0
+        print(f"{etape:<15} {mesure['secondes']:9.3f} s  ({mesure['unites']} unite(s), {par_unite:.3f} ms/unite)")
+
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, indent=2, ensure_ascii=False)
+        print(f"Resultats : {args.sortie}")
+
+    if not args.reference:
+        return 0
+    with open(args.reference, "r", encoding="utf-8") as f:
+        reference = json.load(f)
+    if reference.get("parametres") != parametres:
+        print("Attention : parametres differents de la reference, comparaison indicative.", file=sys.stderr)
+    lignes, regressions = comparer(resultats, reference, args.seuil)
+    print(f"\n{'etape':<15} {'reference':>10} {'mesure':>10} {'ecart':>8}")
+    for etape, ancien, actuel, ecart in lignes:
+        print(f"{etape:<15} {ancien:9.3f}s {actuel:9.3f}s {ecart:+8.1%}")
+    if regressions:
+        print(f"Regression au-dela de {args.seuil:.0%} : {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Generateur de classeurs de factures synthetiques pour les benchmarks.
+
+Colonnes reprises du template de remplissage (export_excel_template) et de
+data/Data.xlsx (nom, prenom, dates en cellules date). Contenu determine par
+la graine : deux appels avec les memes parametres donnent le meme fichier.
+
+Exemple :
+    python benchmarks/workbook_generator.py bench.xlsx --factures 10000 --lignes-par-facture 3
+"""
+import argparse
+import csv
+import random
+from datetime import datetime, timedelta
+
+import openpyxl
+
+
+COLONNES_FACTURE = [
+    "code_projet",
+    "code_sous_projet",
+    "numero_otfi",
+    "pole_emettrice",
+    "pole_destinataire",
+    "dept_dir_emettrice",
+    "dept_dir_destinataire",
+    "date_emission",
+    "date_du_jour",
+    "periode_concernee",
+    "somme_facture",
+    "nom",
+    "prenom",
+]
+COLONNES_LIGNE = ["designation", "type_prestation", "unite", "quantite", "prix_unitaire"]
+FORMATS = ("large", "long", "csv")
+# Format large : colonnes ligne1_ ... ligne5_ de la feuille des factures
+NB_LIGNES_LARGE = 5
+
+_POLES = ["Pole A", "Pole B", "Pole C", "Pole D"]
+_DIRECTIONS = ["Direction X", "Direction Y", "Direction Z"]
+_MOIS = ["Janvier", "Fevrier", "Mars", "Avril", "Mai", "Juin", "Juillet", "Aout", "Septembre", "Octobre", "Novembre", "Decembre"]
+_PRESTATIONS = [("Service", "Lot"), ("Support", "H"), ("Conseil", "J"), ("Licence", "U")]
+_NOMS = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Richard", "Petit", "Durand"]
+_PRENOMS = ["Camille", "Louis", "Lea", "Hugo", "Chloe", "Jules", "Manon", "Adam"]
+
+
+def generer_factures(nb_factures, lignes_par_facture=3, graine=42):
+    """Factures synthetiques : (valeurs de la facture, liste des lignes), somme_facture = total HT."""
+    alea = random.Random(graine)
+    debut = datetime(2025, 1, 1)
+    for i in range(nb_factures):
+        lignes = []
+        for j in range(lignes_par_facture):
+            type_prestation, unite = _PRESTATIONS[alea.randrange(len(_PRESTATIONS))]
+            lignes.append([
+                f"Prestation {j + 1} - {type_prestation.lower()} {alea.randrange(1000):03d}",
+                type_prestation,
+                unite,
+                alea.randint(1, 20),
+                round(alea.uniform(50, 5000), 2),
+            ])
+        total = round(sum(quantite * prix for *_, quantite, prix in lignes), 2)
+        emission = debut + timedelta(days=alea.randrange(365))
+        facture = {
+            "code_projet": f"PRJ-{i // 50:04d}",
+            "code_sous_projet": f"SP-{i // 10:05d}",
+            "numero_otfi": f"OTFI-2025-{i + 1:06d}",
+            "pole_emettrice": alea.choice(_POLES),
+            "pole_destinataire": alea.choice(_POLES),
+            "dept_dir_emettrice": alea.choice(_DIRECTIONS),
+            "dept_dir_destinataire": alea.choice(_DIRECTIONS),
+            "date_emission": emission,
+            "date_du_jour": emission + timedelta(days=alea.randrange(30)),
+            "periode_concernee": f"{_MOIS[emission.month - 1]} 2025",
+            "somme_facture": total,
+            "nom": alea.choice(_NOMS),
+            "prenom": alea.choice(_PRENOMS),
+        }
+        yield facture, lignes
+
+
+def generer_classeur(chemin, nb_factures=1000, lignes_par_facture=3, format="large", graine=42):
+    """
+    Ecrit le fichier d'entree : `large` (colonnes ligneN_, 5 lignes max),
+    `long` (feuilles Factures + Lignes, sans limite) ou `csv` (separateur ;,
+    colonnes ligneN_). Renvoie `chemin`.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Format inconnu : {format} ({', '.join(FORMATS)})")
+    if format != "long" and lignes_par_facture > NB_LIGNES_LARGE:
+        raise ValueError(f"Format {format} : {NB_LIGNES_LARGE} lignes par facture au plus (format long au-dela)")
+
+    entete = list(COLONNES_FACTURE)
+    if format != "long":
+        for idx in range(1, lignes_par_facture + 1):
+            entete.extend(f"ligne{idx}_{champ}" for champ in COLONNES_LIGNE)
+    factures = generer_factures(nb_factures, lignes_par_facture, graine)
+
+    if format == "csv":
+        with open(chemin, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(entete)
+            for facture, lignes in factures:
+                valeurs = [_texte_csv(facture[col]) for col in COLONNES_FACTURE]
+                for ligne in lignes:
+                    valeurs.extend(_texte_csv(val) for val in ligne)
+                writer.writerow(valeurs)
+        return chemin
+
+    wb = openpyxl.Workbook(write_only=True)
+    feuille = wb.create_sheet("Factures")
+    feuille.append(entete)
+    feuille_lignes = None
+    if format == "long":
+        feuille_lignes = wb.create_sheet("Lignes")
+        feuille_lignes.append(["numero_otfi"] + COLONNES_LIGNE)
+    for facture, lignes in factures:
+        valeurs = [facture[col] for col in COLONNES_FACTURE]
+        if feuille_lignes is None:
+            for ligne in lignes:
+                valeurs.extend(ligne)
+        else:
+            for ligne in lignes:
+                feuille_lignes.append([facture["numero_otfi"]] + ligne)
+        feuille.append(valeurs)
+    wb.save(chemin)
+    return chemin
+
+
+def _texte_csv(valeur):
+    """Cellule telle qu'un export ERP l'ecrit : dates JJ/MM/AAAA, decimales a virgule."""
+    if isinstance(valeur, datetime):
+        return valeur.strftime("%d/%m/%Y")
+    if isinstance(valeur, float):
+        return f"{valeur:.2f}".replace(".", ",")
+    return valeur
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genere un classeur de factures synthetique.")
+    parser.add_argument("chemin", help="Fichier a ecrire (.xlsx, ou .csv avec --format csv)")
+    parser.add_argument("--factures", type=int, default=1000, help="Nombre de factures (defaut : 1000)")
+    parser.add_argument("--lignes-par-facture", type=int, default=3, help="Lignes de prestation par facture (defaut : 3)")
+    parser.add_argument("--format", choices=FORMATS, default="large", help="large (ligneN_), long (feuille Lignes) ou csv")
+    parser.add_argument("--graine", type=int, default=42, help="Graine du generateur aleatoire (defaut : 42)")
+    args = parser.parse_args(argv)
+    generer_classeur(args.chemin, args.factures, args.lignes_par_facture, args.format, args.graine)
+    print(args.chemin)
+
+
+if __name__ == "__main__":
+    main()
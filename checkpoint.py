@@ -0,0 +1,96 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from output_manifest import empreinte_fichier
+
+
+NOM_REPRISE = ".facture_reprise.json"
+
+
+def identite_fichier(chemin):
+    """Identite du fichier d'entree : chemin, taille, date de modification et empreinte."""
+    stat = os.stat(chemin)
+    return {
+        "chemin": os.path.abspath(chemin),
+        "taille": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "empreinte": empreinte_fichier(chemin),
+    }
+
+
+def derniere_position(etat):
+    """Derniere ligne traitee d'un lot interrompu : "ligne 12", suivie de la source en multi-sources."""
+    ligne = etat.get("ligne", etat["derniere_ligne"] + 2)
+    source = etat.get("source")
+    return f"ligne {ligne} ({source})" if source else f"ligne {ligne}"
+
+
+class PointReprise:
+    """
+    Point de reprise d'un lot, ecrit dans le dossier de sortie
+    (`.facture_reprise.json`) : identite du fichier Excel (ou de la liste des
+    fichiers d'un lot multi-sources), index de la derniere ligne traitee (les
+    resultats arrivent dans l'ordre), sa ligne dans le fichier et sa source, et
+    fichiers produits.
+    Supprime quand le lot se termine ; apres un arret, `charger` permet de
+    reprendre a la premiere ligne non traitee.
+    """
+
+    def __init__(self, dossier, fichier_entree, intervalle=2.0):
+        self.dossier = dossier
+        self.chemin = os.path.join(dossier, NOM_REPRISE)
+        if isinstance(fichier_entree, (list, tuple)):
+            self.identite = [identite_fichier(fichier) for fichier in fichier_entree]
+        else:
+            self.identite = identite_fichier(fichier_entree)
+        self.intervalle = intervalle
+        self.etat = {"fichier": self.identite, "derniere_ligne": -1, "sorties": [], "erreurs": 0}
+        self.derniere_sauvegarde = time.monotonic()
+
+    def charger(self):
+        """Etat d'un lot interrompu sur le meme fichier (inchange), sinon None."""
+        try:
+            with open(self.chemin, "r", encoding="utf-8") as f:
+                etat = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(etat, dict) or etat.get("fichier") != self.identite:
+            return None
+        if etat.get("derniere_ligne", -1) < 0:
+            return None
+        return etat
+
+    def reprendre(self, etat):
+        """Repart de l'etat `etat` ; renvoie l'index de la premiere ligne a traiter."""
+        self.etat = etat
+        return etat["derniere_ligne"] + 1
+
+    def avancer(self, index, chemin=None, erreur=False, data=None):
+        self.etat["derniere_ligne"] = index
+        if data is not None:
+            self.etat["ligne"] = data.get("_ligne", index + 2)
+            self.etat["source"] = data.get("source")
+        if chemin:
+            self.etat["sorties"].append(chemin)
+        if erreur:
+            self.etat["erreurs"] += 1
+        if time.monotonic() - self.derniere_sauvegarde >= self.intervalle:
+            self.sauver()
+
+    def sauver(self):
+        os.makedirs(self.dossier, exist_ok=True)
+        self.etat["maj"] = datetime.now().isoformat(timespec="seconds")
+        temporaire = self.chemin + ".tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump(self.etat, f, ensure_ascii=False)
+        os.replace(temporaire, self.chemin)
+        self.derniere_sauvegarde = time.monotonic()
+
+    def terminer(self):
+        """Lot complet : le point de reprise n'a plus lieu d'etre."""
+        try:
+            os.remove(self.chemin)
+        except FileNotFoundError:
+            pass
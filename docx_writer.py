@@ -0,0 +1,146 @@
+import struct
+import time
+import zlib
+from zipfile import ZIP_DEFLATED
+
+from docx.opc.pkgwriter import PackageWriter
+
+
+# Niveau zlib des parties recompressees (6 = defaut de zipfile)
+NIVEAU_COMPRESSION = 6
+
+_ENTETE_LOCAL = struct.Struct("<4s5H3L2H")
+_ENTETE_CENTRAL = struct.Struct("<4s6H3L5H2L")
+_FIN_CENTRAL = struct.Struct("<4s4H2LH")
+
+
+def _dos_date_heure(horodatage=None):
+    annee, mois, jour, heure, minute, seconde = time.localtime(horodatage)[:6]
+    annee = max(annee, 1980)
+    return (heure << 11) | (minute << 5) | (seconde // 2), ((annee - 1980) << 9) | (mois << 5) | jour
+
+
+def _deflate(blob, niveau):
+    compresseur = zlib.compressobj(niveau, zlib.DEFLATED, -15)
+    return compresseur.compress(blob) + compresseur.flush()
+
+
+class _Collecte:
+    """Ecrivain factice : garde les parties serialisees en memoire."""
+
+    def __init__(self):
+        self.parties = {}
+
+    def write(self, pack_uri, blob):
+        self.parties[pack_uri.membername] = blob
+
+    def close(self):
+        pass
+
+
+def _ecrire_package(package, writer):
+    """Meme sequence que `PackageWriter.write`, vers l'ecrivain fourni."""
+    for part in package.parts:
+        part.before_marshal()
+    PackageWriter._write_content_types_stream(writer, package.parts)
+    PackageWriter._write_pkg_rels(writer, package.rels)
+    PackageWriter._write_parts(writer, package.parts)
+    writer.close()
+
+
+class PiecesTemplate:
+    """
+    Parties du template telles que python-docx les ecrit, avec leur version
+    compressee calculee une seule fois par niveau. Une partie identique dans la
+    facture (styles, theme, logo, settings...) est recopiee sans recompression.
+    """
+
+    def __init__(self, package):
+        collecte = _Collecte()
+        _ecrire_package(package, collecte)
+        self.parties = {nom: (blob, zlib.crc32(blob)) for nom, blob in collecte.parties.items()}
+        self._compresses = {}
+
+    def compresse(self, nom, blob, niveau):
+        """(crc, donnees compressees) si `blob` est identique au template, sinon None."""
+        connu = self.parties.get(nom)
+        if connu is None or connu[0] != blob:
+            return None
+        cle = (nom, niveau)
+        donnees = self._compresses.get(cle)
+        if donnees is None:
+            donnees = self._compresses[cle] = _deflate(blob, niveau)
+        return connu[1], donnees
+
+
+class EcrivainZip:
+    """
+    Ecrivain de package (interface `write`/`close` de python-docx) qui produit
+    l'archive .docx directement : les parties inchangees reprennent les octets
+    deja compresses de `pieces`, les autres sont compressees au `niveau` donne.
+    """
+
+    def __init__(self, destination, pieces=None, niveau=None):
+        if hasattr(destination, "write"):
+            self.fichier = destination
+            self.proprietaire = False
+        else:
+            self.fichier = open(destination, "wb")
+            self.proprietaire = True
+        self.pieces = pieces
+        self.niveau = NIVEAU_COMPRESSION if niveau is None else niveau
+        self.heure, self.date = _dos_date_heure()
+        self.position = 0
+        self.central = []
+
+    def write(self, pack_uri, blob):
+        nom = pack_uri.membername
+        reprise = self.pieces.compresse(nom, blob, self.niveau) if self.pieces is not None else None
+        if reprise is None:
+            crc, donnees = zlib.crc32(blob), _deflate(blob, self.niveau)
+        else:
+            crc, donnees = reprise
+        self.ecrire_membre(nom, crc, donnees, len(blob))
+
+    def ecrire_membre(self, nom, crc, donnees, taille):
+        """Ajoute un membre deja compresse (deflate brut) a l'archive."""
+        nom_octets = nom.encode("utf-8")
+        drapeaux = 0 if nom_octets.isascii() else 0x800
+        entete = _ENTETE_LOCAL.pack(
+            b"PK\x03\x04", 20, drapeaux, ZIP_DEFLATED, self.heure, self.date,
+            crc, len(donnees), taille, len(nom_octets), 0,
+        )
+        self.central.append((nom_octets, drapeaux, crc, len(donnees), taille, self.position))
+        self.fichier.write(entete)
+        self.fichier.write(nom_octets)
+        self.fichier.write(donnees)
+        self.position += len(entete) + len(nom_octets) + len(donnees)
+
+    def close(self):
+        debut = self.position
+        for nom_octets, drapeaux, crc, taille_compressee, taille, offset in self.central:
+            self.fichier.write(_ENTETE_CENTRAL.pack(
+                b"PK\x01\x02", 20, 20, drapeaux, ZIP_DEFLATED, self.heure, self.date,
+                crc, taille_compressee, taille, len(nom_octets), 0, 0, 0, 0, 0o600 << 16, offset,
+            ))
+            self.fichier.write(nom_octets)
+            self.position += _ENTETE_CENTRAL.size + len(nom_octets)
+        self.fichier.write(_FIN_CENTRAL.pack(
+            b"PK\x05\x06", 0, 0, len(self.central), len(self.central),
+            self.position - debut, debut, 0,
+        ))
+        if self.proprietaire:
+            self.fichier.close()
+        else:
+            self.fichier.flush()
+
+
+def enregistrer_docx(doc, destination, pieces=None, niveau=None):
+    """
+    Equivalent de `DocxTemplate.save` (chemin ou objet fichier) qui reutilise
+    les parties compressees du template au lieu de tout recompresser.
+    """
+    doc.pre_processing()
+    _ecrire_package(doc.docx.part.package, EcrivainZip(destination, pieces, niveau))
+    doc.post_processing(destination)
+    doc.is_saved = True
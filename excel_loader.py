@@ -1,9 +1,15 @@
+import csv
 import os
-import re
 import sys
+from collections import deque
+from datetime import date, datetime
+from itertools import groupby, repeat
 
+import openpyxl
 import pandas as pd
 
+from key_normalizer import normaliser_cle
+
 
 def resource_path(relative_path):
     """
@@ -12,28 +18,11 @@ def resource_path(relative_path):
     try:
         base_path = sys._MEIPASS  # utilise par PyInstaller
     except Exception:
-        base_path = os.path.abspath(".")
+        # Dossier du module, pas le dossier courant (lancement par cron ou script)
+        base_path = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(base_path, relative_path)
 
 
-ACCENT_MAP = {
-    "é": "e",
-    "è": "e",
-    "ê": "e",
-    "ë": "e",
-    "à": "a",
-    "â": "a",
-    "ä": "a",
-    "ù": "u",
-    "û": "u",
-    "ü": "u",
-    "ï": "i",
-    "î": "i",
-    "ô": "o",
-    "ö": "o",
-    "ç": "c",
-}
-
 # Normalized column name -> placeholder attendu dans le docx
 PLACEHOLDER_ALIASES = {
     "code_projet": "code_projet",
@@ -61,83 +50,693 @@ PLACEHOLDER_ALIASES = {
 }
 
 
-def normalize_key(name: str) -> str:
-    """Nettoie un nom de colonne pour matcher les placeholders du template."""
-    base = str(name).strip().lower()
-    for accented, plain in ACCENT_MAP.items():
-        base = base.replace(accented, plain)
-    base = re.sub(r"[^a-z0-9]+", "_", base)
-    return base.strip("_")
+# Nom historique, partage avec generate_facture
+normalize_key = normaliser_cle
+
+
+CHAMPS_LIGNE = ("designation", "type_prestation", "unite", "quantite", "prix_unitaire")
+NB_LIGNES_MAX = 5
+# Format long : feuille "Lignes" (nom normalise), une ligne de prestation par
+# ligne Excel, rattachee a sa facture par la premiere colonne cle trouvee
+FEUILLE_LIGNES = "lignes"
+CLES_LIGNES = ("numero_otfi", "reference")
+# Jointure : groupes de lignes (une facture chacun) lus en avance au plus, pour
+# reconnaitre un groupe hors de l'ordre des factures sans relire la feuille
+FENETRE_LIGNES = 16
+# Entree texte (export ERP)
+EXTENSIONS_CSV = (".csv", ".tsv", ".txt")
+ENCODAGES_CSV = ("utf-8-sig", "cp1252", "latin-1")
+SEPARATEURS_CSV = (";", ",", "\t", "|")
+TAILLE_ECHANTILLON_CSV = 64 * 1024
+# Controle avant rendu : une de ces colonnes doit etre renseignee (meme ordre
+# que nom_facture), ecart admis entre somme_facture et le total HT calcule
+CHAMPS_REFERENCE = ("numero_otfi", "code_sous_projet", "code_projet", "nom")
+TOLERANCE_TOTAL = 0.01
+# Lecture en streaming : lignes converties par blocs, petit premier bloc (premieres
+# factures vite disponibles) puis taille doublee jusqu'au maximum
+TAILLE_BLOC_MIN = 256
+TAILLE_BLOC_MAX = 8192
+_TYPES_DATE = (datetime, date, pd.Timestamp)
+# Types infere par pandas qui excluent toute date : colonne laissee telle quelle
+_SANS_DATE = {"string", "integer", "floating", "mixed-integer-float", "boolean", "empty", "decimal", "bytes"}
+_AVEC_FLOTTANTS = {"floating", "mixed-integer-float", "mixed"}
 
 
-def charger_donnees_excel(fichier_excel):
+def _nombres(serie):
     """
-    Charge un fichier Excel contenant les donnees de facturation.
+    Colonne -> (float, cellules invalides), decimales a la francaise acceptees
+    ("1 234,5") ; vide -> 0, invalide -> 0 et signale dans le masque.
+    """
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return serie.astype(float).fillna(0.0), pd.Series(False, index=serie.index)
+    nombres = pd.to_numeric(serie, errors="coerce").astype(float)
+    # Seules les cellules non converties passent par le nettoyage du texte
+    a_revoir = nombres.isna() & _renseigne(serie)
+    if a_revoir.any():
+        texte = serie[a_revoir].astype(str).str.replace(r"[\s\u00a0]", "", regex=True).str.replace(",", ".", regex=False)
+        nombres[a_revoir] = pd.to_numeric(texte, errors="coerce")
+    return nombres.fillna(0.0), a_revoir & nombres.isna()
 
-    Les noms de colonnes sont normalises (minuscules, accents retires, espaces -> underscore)
-    puis associes aux placeholders du modele Word :
-    code_sous_projet, numero_otfi, pole_emettrice, pole_destinataire,
-    dept_dir_emettrice, dept_dir_destinataire, date_emission, date_du_jour,
-    période_concernee, somme_facture. Les colonnes de lignes de prestations sont
-    supportees sous la forme ligne1_designation, ligne1_type_prestation, ligne1_unite,
-    ligne1_quantite, ligne1_prix_unitaire (jusqu'a 5 lignes).
+
+def _nombre(valeur):
+    """Equivalent de _nombres pour une seule cellule : float, 0.0 si vide, None si invalide."""
+    if isinstance(valeur, (int, float)) and not isinstance(valeur, bool):
+        return 0.0 if valeur != valeur else float(valeur)
+    if not valeur:
+        return 0.0
+    try:
+        return float(str(valeur).replace(" ", "").replace("\u00a0", "").replace(",", "."))
+    except ValueError:
+        return None
+
+
+def _dates_en_texte(serie):
+    """Dates (colonne datetime ou valeurs date isolees) -> texte JJ/MM/AAAA."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.strftime("%d/%m/%Y").fillna("")
+    if serie.dtype == object and pd.api.types.infer_dtype(serie, skipna=True) not in _SANS_DATE:
+        est_date = pd.array([isinstance(val, _TYPES_DATE) for val in serie.tolist()], dtype=bool)
+        if est_date.any():
+            serie = serie.copy()
+            serie[est_date] = pd.to_datetime(serie[est_date]).dt.strftime("%d/%m/%Y")
+    return serie
+
+
+def _entiers(serie):
     """
-    if not os.path.exists(fichier_excel):
-        raise FileNotFoundError(f"Fichier introuvable : {fichier_excel}")
+    Flottants entiers -> int (12.0 -> 12) : une colonne d'entiers avec des
+    cellules vides, lue en float par pandas, donne le meme texte qu'en streaming.
+    """
+    if pd.api.types.is_float_dtype(serie):
+        serie = serie.astype(object)
+    elif serie.dtype != object or pd.api.types.infer_dtype(serie, skipna=True) not in _AVEC_FLOTTANTS:
+        return serie
+    valeurs = serie.tolist()
+    est_entier = pd.array([isinstance(val, float) and val.is_integer() for val in valeurs], dtype=bool)
+    if est_entier.any():
+        serie = serie.copy()
+        serie[est_entier] = [int(val) for val, entier in zip(valeurs, est_entier) if entier]
+    return serie
 
-    df = pd.read_excel(fichier_excel, engine="openpyxl").fillna("")
 
-    normalized = [normalize_key(col) for col in df.columns]
-    df.columns = normalized
+def _renseigne(serie):
+    """Meme test que `bool(valeur)` pour les cellules : ni vide, ni 0, ni NaN."""
+    return serie.notna() & (serie != "") & (serie != 0)
 
-    def to_float(val):
-        try:
-            return float(str(val).replace(",", "."))
-        except Exception:
-            return 0.0
 
-    for _, row in df.iterrows():
-        record = {col: row[col] for col in df.columns}
+def _colonne_alias(colonnes, champ):
+    """Colonne lue pour le placeholder `champ` (le dernier alias present l'emporte, comme dans PlanColonnes)."""
+    trouvees = [nom for nom, placeholder in PLACEHOLDER_ALIASES.items() if placeholder == champ and nom in colonnes]
+    return trouvees[-1] if trouvees else None
+
+
+def _colonne_somme(colonnes):
+    """Colonne lue pour somme_facture."""
+    return _colonne_alias(colonnes, "somme_facture")
+
+
+def _colonnes_reference(colonnes):
+    """Colonnes lues pour les champs de CHAMPS_REFERENCE, alias compris (nom n'a pas d'alias)."""
+    references = [_colonne_alias(colonnes, champ) for champ in CHAMPS_REFERENCE if champ != "nom"]
+    if "nom" in colonnes:
+        references.append("nom")
+    return [col for col in references if col is not None]
+
+
+def _ecart_total(somme, total):
+    """Motif de rejet si somme_facture ne correspond pas au total HT calcule, sinon None."""
+    if abs(somme - total) <= TOLERANCE_TOTAL:
+        return None
+    return f"somme_facture ({somme:.2f}) differente du total HT calcule ({total:.2f})"
+
+
+def _rejets(df, controles, premiere_ligne):
+    """
+    Colonne _rejet : None pour une ligne valide, sinon {"ligne", "motif"}.
+    `controles` : (masque, motif) ou motif est un texte, ou une liste de textes
+    pour les seules lignes du masque. Seules les lignes rejetees sont parcourues.
+    """
+    motifs = {}
+    for masque, motif in controles:
+        positions = masque.to_numpy().nonzero()[0]
+        if not len(positions):
+            continue
+        textes = [motif] * len(positions) if isinstance(motif, str) else motif
+        for position, texte in zip(positions.tolist(), textes):
+            motifs.setdefault(position, []).append(texte)
+    colonne = [None] * len(df)
+    for position, textes in motifs.items():
+        colonne[position] = {"ligne": premiere_ligne + position, "motif": "; ".join(textes)}
+    return colonne
 
-        mapped = {}
-        for norm_key, placeholder in PLACEHOLDER_ALIASES.items():
-            if norm_key in record:
-                mapped[placeholder] = record.get(norm_key, "")
 
+def _coercer(df, premiere_ligne=2, controle_total=True):
+    """
+    Conversion typee de tout le bloc, colonne par colonne : dates en JJ/MM/AAAA,
+    quantites et prix unitaires en float, ligneN_montant = quantite * prix et
+    total_ht en arithmetique de colonnes. Ajoute ligneN_presente (ligne renseignee).
+
+    Controle avant rendu, par colonnes lui aussi : ligne vide, reference
+    absente, quantite ou prix non numerique, somme_facture differente du total
+    HT (si `controle_total`). Ajoute _rejet (voir _rejets), `premiere_ligne`
+    etant le numero Excel de la premiere ligne du bloc.
+    """
+    df = df.loc[:, ~df.columns.duplicated(keep="last")].copy()
+    vide = (df == "").all(axis=1)
+    pleine = ~vide
+    controles = [(vide, "ligne vide")]
+    references = _colonnes_reference(df.columns)
+    reference = pd.Series(False, index=df.index)
+    for col in references:
+        reference |= _renseigne(df[col])
+    controles.append((pleine & ~reference, f"reference manquante ({', '.join(CHAMPS_REFERENCE)})"))
+
+    numeriques = {f"ligne{idx}_{champ}" for idx in range(1, NB_LIGNES_MAX + 1) for champ in ("quantite", "prix_unitaire")}
+    for col in df.columns:
+        if col not in numeriques:
+            df[col] = _entiers(_dates_en_texte(df[col]))
+
+    total = None
+    avec_lignes = pd.Series(False, index=df.index)
+    for idx in range(1, NB_LIGNES_MAX + 1):
+        prefix = f"ligne{idx}_"
+        colonnes = [prefix + champ for champ in CHAMPS_LIGNE if prefix + champ in df.columns]
+        if not colonnes:
+            continue
+        presente = _renseigne(df[colonnes[0]])
+        for col in colonnes[1:]:
+            presente |= _renseigne(df[col])
+        valeurs = {}
+        for champ in ("quantite", "prix_unitaire"):
+            col = prefix + champ
+            if col not in df.columns:
+                valeurs[champ] = pd.Series(0.0, index=df.index)
+                continue
+            valeurs[champ], invalides = _nombres(df[col])
+            invalides &= pleine
+            if invalides.any():
+                controles.append((invalides, [f"{col} non numerique ({val})" for val in df[col][invalides].tolist()]))
+        quantite = valeurs["quantite"]
+        prix = valeurs["prix_unitaire"]
+        montant = quantite * prix
+        df[prefix + "quantite"] = quantite
+        df[prefix + "prix_unitaire"] = prix
+        df[prefix + "montant"] = montant
+        df[prefix + "presente"] = presente
+        avec_lignes |= presente
+        montant = montant.where(presente, 0.0)
+        total = montant if total is None else total + montant
+    if total is not None:
+        df["total_ht"] = total
+
+    colonne_somme = _colonne_somme(df.columns)
+    if controle_total and colonne_somme is not None and total is not None:
+        somme, invalides = _nombres(df[colonne_somme])
+        a_controler = pleine & _renseigne(df[colonne_somme])
+        controles.append((a_controler & invalides, f"{colonne_somme} non numerique"))
+        ecart = a_controler & ~invalides & avec_lignes & ((somme - total).abs() > TOLERANCE_TOTAL)
+        if ecart.any():
+            controles.append((ecart, [_ecart_total(s, t) for s, t in zip(somme[ecart].tolist(), total[ecart].tolist())]))
+    df["_rejet"] = _rejets(df, controles, premiere_ligne)
+    return df
+
+
+class PlanColonnes:
+    """
+    Correspondance colonnes -> donnees du template, resolue une fois par entete
+    de classeur : placeholder -> position de colonne, et pour chaque ligne de
+    prestation les positions de ses champs. Une colonne absente pointe sur une
+    valeur vide ajoutee en fin d'enregistrement ; chaque ligne du fichier est
+    ensuite mappee par simple acces par index.
+    """
+
+    def __init__(self, colonnes):
+        # Colonnes telles que produites par _coercer (une seule par nom)
+        self.colonnes = list(colonnes)
+        position = {col: idx for idx, col in enumerate(self.colonnes)}
+        vide = len(self.colonnes)
+
+        # Plusieurs alias pour un placeholder : la derniere colonne trouvee l'emporte
+        champs = {}
+        for norm_key, placeholder in PLACEHOLDER_ALIASES.items():
+            if norm_key in position:
+                champs[placeholder] = position[norm_key]
+        self.champs = tuple(champs.items())
         # Champs optionnels utiles pour le nommage de fichier
-        mapped["nom"] = record.get("nom", "")
-        mapped["prenom"] = record.get("prenom", "")
+        self.nom = position.get("nom", vide)
+        self.prenom = position.get("prenom", vide)
 
-        # Lignes de prestations : support jusqu'a 5 lignes
-        lignes = []
-        for idx in range(1, 6):
+        self.lignes = []
+        for idx in range(1, NB_LIGNES_MAX + 1):
             prefix = f"ligne{idx}_"
-            designation = record.get(prefix + "designation", "")
-            type_prest = record.get(prefix + "type_prestation", "")
-            unite = record.get(prefix + "unite", "")
-            qte_raw = record.get(prefix + "quantite", "")
-            pu_raw = record.get(prefix + "prix_unitaire", "")
-
-            if not any([designation, type_prest, unite, qte_raw, pu_raw]):
+            if prefix + "presente" not in position:
                 continue
+            self.lignes.append(
+                (position[prefix + "presente"],)
+                + tuple(position.get(prefix + champ, vide) for champ in ("designation", "type_prestation", "unite"))
+                + tuple(position[prefix + champ] for champ in ("quantite", "prix_unitaire", "montant"))
+            )
+        self.total_ht = position.get("total_ht")
+        self.rejet = position.get("_rejet", vide)
 
-            quantite = to_float(qte_raw)
-            prix_unitaire = to_float(pu_raw)
-            montant = quantite * prix_unitaire
+    def mapper(self, valeurs):
+        """Donnees pour le template a partir des valeurs d'une ligne (+ valeur vide en fin)."""
+        mapped = {placeholder: valeurs[idx] for placeholder, idx in self.champs}
+        mapped["nom"] = valeurs[self.nom]
+        mapped["prenom"] = valeurs[self.prenom]
+
+        lignes = []
+        for presente, designation, type_prestation, unite, quantite, prix, montant in self.lignes:
+            if not valeurs[presente]:
+                continue
             lignes.append(
                 {
                     "numero": len(lignes) + 1,
-                    "designation": designation,
-                    "type_prestation": type_prest,
-                    "unite": unite,
-                    "quantite": quantite,
-                    "prix_unitaire": prix_unitaire,
-                    "montant": montant,
+                    "designation": valeurs[designation],
+                    "type_prestation": valeurs[type_prestation],
+                    "unite": valeurs[unite],
+                    "quantite": valeurs[quantite],
+                    "prix_unitaire": valeurs[prix],
+                    "montant": valeurs[montant],
                 }
             )
 
         if lignes:
             mapped["lignes"] = lignes
-            mapped["total_ht"] = sum(l["montant"] for l in lignes)
+            mapped["total_ht"] = valeurs[self.total_ht]
+
+        # Ligne refusee par le controle avant rendu : {"ligne", "motif"}
+        if valeurs[self.rejet]:
+            mapped["rejet"] = valeurs[self.rejet]
+
+        return mapped
+
+    def mapper_bloc(self, df, premiere_ligne=2):
+        """
+        Enregistrements d'un bloc deja converti par _coercer. Chacun porte son
+        numero de ligne dans le fichier (`_ligne`, `premiere_ligne` pour le premier).
+        """
+        # tolist() par colonne : valeurs Python natives, bien plus rapide que to_dict("records")
+        colonnes = [df[col].tolist() for col in self.colonnes]
+        colonnes.append(repeat(""))
+        for numero, valeurs in enumerate(zip(*colonnes), start=premiere_ligne):
+            record = self.mapper(valeurs)
+            record["_ligne"] = numero
+            yield record
+
+
+def _mapper_bloc(df, plan=None, premiere_ligne=2, controle_total=True):
+    """
+    Convertit un bloc (DataFrame aux colonnes normalisees) et renvoie le plan
+    utilise et un iterateur sur ses enregistrements. Le plan d'un bloc precedent
+    du meme classeur est reutilise.
+    """
+    df = _coercer(df, premiere_ligne, controle_total)
+    if plan is None:
+        plan = PlanColonnes(df.columns)
+    return plan, plan.mapper_bloc(df, premiere_ligne)
+
+
+def _entetes_pandas(header):
+    """Reproduit les noms de colonnes de pd.read_excel (Unnamed: n, doublons suffixes .1, .2...)."""
+    trimmed = list(header)
+    while trimmed and trimmed[-1] is None:
+        trimmed.pop()
+    noms = []
+    vus = {}
+    for idx, val in enumerate(trimmed):
+        nom = f"Unnamed: {idx}" if val is None or val == "" else val
+        if nom in vus:
+            vus[nom] += 1
+            nom = f"{nom}.{vus[nom]}"
+        else:
+            vus[nom] = 0
+        noms.append(nom)
+    return noms
+
+
+def _feuilles(wb):
+    """(feuille des factures, feuille des lignes ou None) d'un classeur."""
+    lignes = None
+    factures = None
+    for ws in wb.worksheets:
+        if lignes is None and normalize_key(ws.title) == FEUILLE_LIGNES:
+            lignes = ws
+        elif factures is None:
+            factures = ws
+    return factures if factures is not None else wb.worksheets[0], lignes
+
+
+def _blocs(rows, largeur):
+    """
+    Lignes de donnees (listes de `largeur` valeurs, None -> "") regroupees en
+    blocs de TAILLE_BLOC_MIN a TAILLE_BLOC_MAX lignes.
+    """
+    bloc = []
+    taille_bloc = TAILLE_BLOC_MIN
+    # Comme pandas : les lignes vides intermediaires sont gardees, celles de fin ignorees
+    vides_en_attente = 0
+    for row in rows:
+        values = ["" if val is None else val for val in row[:largeur]]
+        if not any(val != "" for val in values):
+            vides_en_attente += 1
+            continue
+        bloc.extend([[""] * largeur for _ in range(vides_en_attente)])
+        vides_en_attente = 0
+        values.extend([""] * (largeur - len(values)))
+        bloc.append(values)
+        if len(bloc) >= taille_bloc:
+            yield bloc
+            bloc = []
+            taille_bloc = min(taille_bloc * 2, TAILLE_BLOC_MAX)
+    if bloc:
+        yield bloc
+
+
+def _records(rows, controle_total=True):
+    """Enregistrements d'un tableau de factures (entete puis lignes), convertis par blocs."""
+    header = next(rows, None)
+    if header is None:
+        return
+    colonnes = [normalize_key(col) for col in _entetes_pandas(header)]
+    plan = None
+    premiere_ligne = 2
+    for bloc in _blocs(rows, len(colonnes)):
+        plan, records = _mapper_bloc(pd.DataFrame(bloc, columns=colonnes), plan, premiere_ligne, controle_total)
+        premiere_ligne += len(bloc)
+        yield from records
+
+
+def _cle_reference(valeur):
+    """Reference de facture comparable entre les deux feuilles (12 == 12.0 == "12"), None si vide."""
+    if isinstance(valeur, float) and valeur.is_integer():
+        valeur = int(valeur)
+    texte = str(valeur).strip()
+    return texte or None
+
+
+def _verifier_factures(ws):
+    """Entete seule de la feuille des factures : numero_otfi requis pour la jointure avec la feuille Lignes."""
+    header = next(ws.iter_rows(max_row=1, values_only=True), None)
+    if "numero_otfi" not in [normalize_key(col) for col in _entetes_pandas(header or ())]:
+        raise ValueError("Feuille des factures : colonne numero_otfi requise avec une feuille Lignes")
+
+
+def _lignes_feuille(ws):
+    """
+    Lignes de prestations de la feuille Lignes, dans l'ordre :
+    (numero de ligne Excel, reference ou None, motifs de rejet, ligne). Conversion
+    par blocs comme les factures ; les lignes sans aucun champ renseigne sont ignorees.
+    """
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    colonnes = [normalize_key(col) for col in _entetes_pandas(header)]
+    cle = next((nom for nom in CLES_LIGNES if nom in colonnes), None)
+    if cle is None:
+        raise ValueError(f"Feuille {ws.title} : colonne {' ou '.join(CLES_LIGNES)} requise")
+    numero = 2
+    for bloc in _blocs(rows, len(colonnes)):
+        premiere = numero
+        df = pd.DataFrame(bloc, columns=colonnes)
+        df = df.loc[:, ~df.columns.duplicated(keep="last")]
+        vide = pd.Series("", index=df.index, dtype=object)
+        presente = pd.Series(False, index=df.index)
+        champs = {}
+        for champ in CHAMPS_LIGNE:
+            if champ in df.columns:
+                presente |= _renseigne(df[champ])
+                champs[champ] = df[champ]
+            else:
+                champs[champ] = vide
+        quantite, quantite_invalide = _nombres(champs["quantite"])
+        prix, prix_invalide = _nombres(champs["prix_unitaire"])
+        colonnes_bloc = [
+            df[cle].tolist(),
+            presente.tolist(),
+            _dates_en_texte(champs["designation"]).tolist(),
+            _dates_en_texte(champs["type_prestation"]).tolist(),
+            _dates_en_texte(champs["unite"]).tolist(),
+            quantite.tolist(),
+            prix.tolist(),
+            (quantite * prix).tolist(),
+        ]
+        # Cellules non numeriques : seules les lignes concernees sont parcourues
+        invalides = {}
+        for champ, masque in (("quantite", quantite_invalide), ("prix_unitaire", prix_invalide)):
+            for position, val in zip(masque.to_numpy().nonzero()[0].tolist(), champs[champ][masque].tolist()):
+                invalides.setdefault(position, []).append(
+                    f"{ws.title} ligne {premiere + position} : {champ} non numerique ({val})"
+                )
+        for position, (reference, est_presente, designation, type_prestation, unite, qte, pu, montant) in enumerate(
+            zip(*colonnes_bloc)
+        ):
+            numero = premiere + position
+            if est_presente:
+                yield numero, _cle_reference(reference), invalides.get(position, []), {
+                    "designation": designation,
+                    "type_prestation": type_prestation,
+                    "unite": unite,
+                    "quantite": qte,
+                    "prix_unitaire": pu,
+                    "montant": montant,
+                }
+        numero = premiere + len(bloc)
+
+
+def _ajouter_rejet(record, numero, motif):
+    rejet = record.get("rejet")
+    if rejet:
+        rejet["motif"] += "; " + motif
+    else:
+        record["rejet"] = {"ligne": numero, "motif": motif}
+
+
+def _groupe_ecarte(reference, groupe):
+    """Rejet d'un groupe de la feuille Lignes sans facture a cette place : {"ligne", "reference", "motif"}."""
+    numero = groupe[0][0]
+    if reference is None:
+        motif = "reference de facture manquante"
+    else:
+        motif = f"facture {reference} introuvable, ou ses lignes hors de l'ordre de la feuille des factures"
+    return {"ligne": numero, "reference": reference or "", "motif": f"Feuille Lignes ligne {numero} : {motif}"}
+
+
+def _joindre_lignes(records, lignes):
+    """
+    Fusion en un seul passage des factures et des lignes de la feuille Lignes,
+    rangees dans l'ordre des factures (lignes d'une facture consecutives). Les
+    groupes de lignes (une facture) sont lus en avance, FENETRE_LIGNES au plus :
+    si celui de la facture en cours y est, ceux qui le precedent sont hors de
+    l'ordre (ou sans facture) et sont ecartes, et une facture dont des lignes
+    ont ete ecartees plus tot est rejetee. Les groupes ecartes ne sont pas des
+    enregistrements : ils sont portes par la facture suivante (la derniere pour
+    ceux de fin de feuille) dans `_lignes_ecartees`, pour le rapport des rejets.
+    Les lignes ajoutees suivent les eventuelles colonnes ligneN_ et total_ht est
+    recalcule. Le controle somme_facture / total HT est fait ici, une fois les
+    lignes connues ; une ligne invalide rejette sa facture.
+    """
+    groupes = ((reference, list(groupe)) for reference, groupe in groupby(lignes, key=lambda item: item[1]))
+    attente = deque()
+    ecartees = set()
+    ecartes = []
+    precedent = None
+    for record in records:
+        numero = record["_ligne"]
+        cle = _cle_reference(record.get("numero_otfi", ""))
+        groupe = None
+        if cle is not None:
+            position = next((i for i, (reference, _) in enumerate(attente) if reference == cle), None)
+            while position is None and len(attente) < FENETRE_LIGNES:
+                suivant = next(groupes, None)
+                if suivant is None:
+                    break
+                attente.append(suivant)
+                if suivant[0] == cle:
+                    position = len(attente) - 1
+            if position is not None:
+                for _ in range(position):
+                    reference, ecarte = attente.popleft()
+                    ecartees.add(reference)
+                    ecartes.append(_groupe_ecarte(reference, ecarte))
+                groupe = attente.popleft()[1]
+            if cle in ecartees:
+                _ajouter_rejet(record, numero, "lignes de la feuille Lignes non consecutives ou hors de l'ordre des factures")
+        if groupe:
+            lignes_facture = record.get("lignes", [])
+            for _, _, motifs, ligne in groupe:
+                lignes_facture.append({"numero": len(lignes_facture) + 1, **ligne})
+                for motif in motifs:
+                    _ajouter_rejet(record, numero, motif)
+            record["lignes"] = lignes_facture
+            record["total_ht"] = record.get("total_ht", 0.0) + sum(ligne["montant"] for _, _, _, ligne in groupe)
+        if "total_ht" in record and record.get("somme_facture"):
+            somme = _nombre(record["somme_facture"])
+            motif = "somme_facture non numerique" if somme is None else _ecart_total(somme, record["total_ht"])
+            if motif:
+                _ajouter_rejet(record, numero, motif)
+        if ecartes:
+            record["_lignes_ecartees"] = ecartes
+            ecartes = []
+        # Facture rendue avec un enregistrement de retard : les groupes de fin de feuille lui sont rattaches
+        if precedent is not None:
+            yield precedent
+        precedent = record
+    if precedent is not None:
+        restants = [_groupe_ecarte(reference, groupe) for reference, groupe in attente]
+        restants += [_groupe_ecarte(reference, groupe) for reference, groupe in groupes]
+        if restants:
+            precedent.setdefault("_lignes_ecartees", []).extend(restants)
+        yield precedent
+
+
+def _iterer_records_streaming(fichier_excel, feuille=None):
+    """
+    Lecture ligne a ligne via openpyxl en mode read-only, conversion par blocs
+    (TAILLE_BLOC_MIN a TAILLE_BLOC_MAX lignes) : memoire bornee, premieres
+    factures disponibles des le premier bloc lu. Avec une feuille Lignes, les
+    deux feuilles sont lues en parallele et jointes au fil de l'eau. Avec
+    `feuille`, seule cette feuille est lue (sans jointure).
+    """
+    wb = openpyxl.load_workbook(fichier_excel, read_only=True, data_only=True)
+    try:
+        if feuille is not None:
+            yield from _records(wb[feuille].iter_rows(values_only=True))
+            return
+        factures, feuille_lignes = _feuilles(wb)
+        records = _records(factures.iter_rows(values_only=True), controle_total=feuille_lignes is None)
+        if feuille_lignes is not None:
+            _verifier_factures(factures)
+            records = _joindre_lignes(records, _lignes_feuille(feuille_lignes))
+        yield from records
+    finally:
+        wb.close()
+
+
+def est_csv(fichier):
+    """True pour un export texte (CSV/TSV) plutot qu'un classeur Excel."""
+    return os.path.splitext(fichier)[1].lower() in EXTENSIONS_CSV
+
+
+def _detecter_csv(fichier):
+    """
+    (encodage, separateur) d'un fichier CSV/TSV d'apres son debut : UTF-8
+    (avec ou sans BOM), sinon Windows-1252 / Latin-1 ; separateur le plus
+    frequent de la ligne d'entete parmi ; , tabulation et |.
+    """
+    with open(fichier, "rb") as f:
+        echantillon = f.read(TAILLE_ECHANTILLON_CSV)
+    for encodage in ENCODAGES_CSV:
+        try:
+            texte = echantillon.decode(encodage)
+        except UnicodeDecodeError as exc:
+            # Echantillon coupe au milieu d'un caractere multi-octets
+            if len(echantillon) < TAILLE_ECHANTILLON_CSV or exc.start < len(echantillon) - 3:
+                continue
+            texte = echantillon[: exc.start].decode(encodage)
+        break
+    if os.path.splitext(fichier)[1].lower() == ".tsv":
+        return encodage, "\t"
+    entete = texte.split("\n", 1)[0]
+    separateur = max(SEPARATEURS_CSV, key=entete.count)
+    return encodage, separateur if entete.count(separateur) else ";"
+
+
+def _iterer_records_csv(fichier):
+    """Lecture en streaming d'un CSV/TSV (module csv), memes blocs et conversions que pour Excel."""
+    encodage, separateur = _detecter_csv(fichier)
+    with open(fichier, "r", encoding=encodage, newline="") as f:
+        yield from _records(csv.reader(f, delimiter=separateur))
+
+
+def _format_long(fichier_excel):
+    """True si le classeur contient une feuille Lignes."""
+    wb = openpyxl.load_workbook(fichier_excel, read_only=True)
+    try:
+        return _feuilles(wb)[1] is not None
+    finally:
+        wb.close()
+
+
+def lister_feuilles(fichier_excel):
+    """
+    Feuilles de factures d'un classeur, dans l'ordre. Un classeur au format
+    long (feuille Lignes) forme un tout : renvoie None. CSV/TSV : None.
+    """
+    if est_csv(fichier_excel):
+        return None
+    wb = openpyxl.load_workbook(fichier_excel, read_only=True)
+    try:
+        if _feuilles(wb)[1] is not None:
+            return None
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def compter_lignes_excel(fichier_excel, feuille=None):
+    """
+    Nombre approximatif de lignes de donnees (dimension declaree de la feuille
+    des factures, ou de `feuille`), sans lire les cellules. Renvoie None si la
+    feuille ne la declare pas. Pour un CSV/TSV : nombre de fins de ligne, hors entete.
+    """
+    if est_csv(fichier_excel):
+        with open(fichier_excel, "rb") as f:
+            return max(sum(bloc.count(b"\n") for bloc in iter(lambda: f.read(1024 * 1024), b"")) - 1, 0)
+    wb = openpyxl.load_workbook(fichier_excel, read_only=True)
+    try:
+        max_row = (wb[feuille] if feuille is not None else _feuilles(wb)[0]).max_row
+    finally:
+        wb.close()
+    if max_row is None:
+        return None
+    return max(max_row - 1, 0)
+
+
+def charger_donnees_excel(fichier_excel, streaming=False, feuille=None):
+    """
+    Charge un fichier Excel contenant les donnees de facturation.
+
+    Les noms de colonnes sont normalises (minuscules, accents retires, espaces -> underscore)
+    puis associes aux placeholders du modele Word :
+    code_sous_projet, numero_otfi, pole_emettrice, pole_destinataire,
+    dept_dir_emettrice, dept_dir_destinataire, date_emission, date_du_jour,
+    période_concernee, somme_facture. Les colonnes de lignes de prestations sont
+    supportees sous la forme ligne1_designation, ligne1_type_prestation, ligne1_unite,
+    ligne1_quantite, ligne1_prix_unitaire (jusqu'a 5 lignes).
+
+    Format long, sans limite de lignes : une feuille "Lignes" (colonnes numero_otfi
+    ou reference, designation, type_prestation, unite, quantite, prix_unitaire),
+    une ligne de prestation par ligne Excel, rangee dans l'ordre des factures.
+    Elle est jointe en streaming a la premiere autre feuille (les factures).
+
+    Les colonnes sont converties en bloc (vectorise) : dates au format JJ/MM/AAAA,
+    quantites et prix unitaires en nombres (virgule decimale acceptee), montants
+    de lignes et total_ht calcules par colonne.
+
+    Un fichier .csv, .tsv ou .txt (export ERP) est lu en streaming avec le module
+    csv (encodage et separateur detectes) : memes colonnes, memes enregistrements.
+
+    Avec streaming=True, le classeur est lu ligne a ligne (openpyxl read-only) au lieu
+    d'etre charge en entier : memes enregistrements, memoire constante.
+    `feuille` : nom de la feuille a lire (par defaut la premiere, voir lister_feuilles).
+    """
+    if not os.path.exists(fichier_excel):
+        raise FileNotFoundError(f"Fichier introuvable : {fichier_excel}")
+
+    if est_csv(fichier_excel):
+        yield from _iterer_records_csv(fichier_excel)
+        return
+
+    if streaming or feuille is not None or _format_long(fichier_excel):
+        yield from _iterer_records_streaming(fichier_excel, feuille)
+        return
+
+    df = pd.read_excel(fichier_excel, engine="openpyxl").fillna("")
+
+    normalized = [normalize_key(col) for col in df.columns]
+    df.columns = normalized
 
-        yield mapped
+    _, records = _mapper_bloc(df)
+    yield from records
@@ -0,0 +1,201 @@
+"""
+Generation de factures en ligne de commande, sans interface graphique.
+
+Exemples :
+    python facture_cli.py factures.xlsx -o sortie/ --workers 8 --stats
+    python facture_cli.py factures.xlsx --zip lot.zip --taille-zip 500
+    python facture_cli.py export_erp.csv -o sortie/
+    python facture_cli.py dir_a.xlsx dir_b.xlsx --toutes-feuilles -o sortie/
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+from archive_writer import ArchiveFactures
+from batch_generator import iterer_lot, position_resultat
+from checkpoint import PointReprise, derniere_position
+from excel_loader import charger_donnees_excel
+from output_manifest import ManifesteSortie
+from rejects_report import RapportRejets, chemin_rejets
+from source_loader import charger_sources
+
+
+def _afficher_progression(compteur, erreurs, debut):
+    ecoule = time.perf_counter() - debut
+    debit = compteur / ecoule if ecoule > 0 else 0.0
+    print(f"  {compteur} ligne(s) traitee(s), {erreurs} erreur(s), {debit:.1f} factures/s", file=sys.stderr)
+
+
+def _verifier(records, rapport):
+    """Controle avant rendu de tout le fichier : aucune facture generee, seulement le rapport des rejets."""
+    total = 0
+    for data in records:
+        total += 1
+        rapport.noter(data)
+    chemin = rapport.fermer()
+    if chemin:
+        print(f"{len(rapport.rejets)} ligne(s) rejetee(s) sur {total} : {chemin}", file=sys.stderr)
+        return 1
+    print(f"{total} ligne(s) valide(s), aucun rejet", file=sys.stderr)
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Genere les factures Word depuis un fichier Excel.")
+    parser.add_argument(
+        "entree", nargs="+",
+        help="Fichier(s) des factures : Excel (.xlsx) ou CSV/TSV (.csv, .tsv, .txt), lus en parallele s'il y en a plusieurs",
+    )
+    parser.add_argument(
+        "--toutes-feuilles", action="store_true",
+        help="Lit toutes les feuilles de chaque classeur (une feuille par pole...), pas seulement la premiere",
+    )
+    sortie = parser.add_mutually_exclusive_group(required=True)
+    sortie.add_argument("-o", "--sortie", help="Dossier de sortie des factures")
+    sortie.add_argument("--zip", help="Archive ZIP de sortie (aucun fichier .docx intermediaire)")
+    parser.add_argument(
+        "--taille-zip", type=float, default=None, metavar="MO",
+        help="Taille max d'une partie d'archive en Mo (decoupe en <nom>_001.zip, ...)",
+    )
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Nombre de processus (defaut : nombre de coeurs)")
+    parser.add_argument("--timeout", type=float, default=None, help="Delai max par facture, en secondes")
+    parser.add_argument(
+        "--compression", type=int, choices=range(10), default=None, metavar="0-9",
+        help="Niveau de compression des parties modifiees de chaque .docx (defaut : 6)",
+    )
+    parser.add_argument(
+        "--fsync", type=int, default=0, metavar="N",
+        help="Synchronisation disque : 0 = aucune (defaut), 1 = chaque facture, N = toutes les N factures",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Avec -o : regenere toutes les factures, meme celles inchangees depuis le dernier lancement",
+    )
+    parser.add_argument(
+        "--reprendre", action="store_true",
+        help="Avec -o : reprend un lot interrompu sur le meme fichier a la premiere ligne non traitee",
+    )
+    parser.add_argument(
+        "--verifier", action="store_true",
+        help="Controle seulement les lignes (reference, nombres, somme_facture = total HT) et ecrit le rapport des rejets, sans generer",
+    )
+    parser.add_argument("--stats", action="store_true", help="Affiche la progression et un resume du debit")
+    parser.add_argument("--progression", type=int, default=100, help="Intervalle d'affichage de la progression (lignes)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for entree in args.entree:
+        if not os.path.exists(entree):
+            print(f"Fichier introuvable : {entree}", file=sys.stderr)
+            return 2
+    multi_sources = len(args.entree) > 1 or args.toutes_feuilles
+
+    debut = time.perf_counter()
+    compteur = 0
+    erreurs = 0
+    duree_rendu = 0.0
+    ignores = 0
+    if multi_sources:
+        records = charger_sources(args.entree, args.toutes_feuilles, workers=args.workers)
+    else:
+        records = charger_donnees_excel(args.entree[0], streaming=True)
+    rapport = RapportRejets(chemin_rejets(args.sortie, args.zip))
+    if args.verifier:
+        return _verifier(records, rapport)
+
+    archive = None
+    manifeste = None
+    reprise = None
+    depart = 0
+    if args.sortie:
+        manifeste = ManifesteSortie(args.sortie, force=args.force)
+        reprise = PointReprise(args.sortie, args.entree if multi_sources else args.entree[0])
+        etat = reprise.charger()
+        if etat is not None and args.reprendre:
+            depart = reprise.reprendre(etat)
+            rapport.reprendre()
+            print(
+                f"Reprise apres la {derniere_position(etat)} ({len(etat['sorties'])} facture(s) deja generee(s))",
+                file=sys.stderr,
+            )
+        elif etat is not None:
+            print(
+                f"Un lot precedent sur ce fichier s'est arrete apres la {derniere_position(etat)} : "
+                "relancer avec --reprendre pour continuer a partir de la ligne suivante.",
+                file=sys.stderr,
+            )
+    if args.zip:
+        taille_max = int(args.taille_zip * 1024 * 1024) if args.taille_zip else None
+        archive = ArchiveFactures(args.zip, taille_max=taille_max)
+    resultats = iterer_lot(
+        records, args.sortie, workers=args.workers, timeout=args.timeout, niveau_compression=args.compression,
+        ignorer=manifeste.a_jour if manifeste is not None else None, depart=depart, fsync_tous=args.fsync,
+    )
+    termine = False
+    parties = None
+    try:
+        for resultat in resultats:
+            compteur += 1
+            ignores += resultat["ignore"]
+            duree_rendu += resultat["duree"]
+            rapport.noter(resultat["data"])
+            if resultat["erreur"]:
+                erreurs += 1
+                print(f"{position_resultat(resultat)} : {resultat['erreur']}", file=sys.stderr)
+                if archive is not None:
+                    archive.noter_erreur(position_resultat(resultat), resultat["erreur"])
+            elif archive is not None:
+                archive.ajouter(position_resultat(resultat), resultat["nom"], resultat["contenu"])
+            elif manifeste is not None and not resultat["ignore"]:
+                manifeste.enregistrer(resultat["data"], resultat["chemin"])
+            if reprise is not None:
+                reprise.avancer(resultat["index"], resultat["chemin"], erreur=bool(resultat["erreur"]), data=resultat["data"])
+            if args.stats and args.progression > 0 and compteur % args.progression == 0:
+                _afficher_progression(compteur, erreurs, debut)
+        termine = True
+    except KeyboardInterrupt:
+        print(f"Interrompu apres {compteur} ligne(s).", file=sys.stderr)
+        if reprise is not None:
+            print("Relancer avec --reprendre pour continuer.", file=sys.stderr)
+        return 130
+    finally:
+        # Arret (Ctrl+C, erreur) : le point de reprise et le manifeste restent a jour
+        if reprise is not None:
+            if termine:
+                reprise.terminer()
+            else:
+                reprise.sauver()
+        if manifeste is not None:
+            manifeste.sauver()
+        chemin = rapport.fermer()
+        if chemin:
+            print(f"{len(rapport.rejets)} ligne(s) rejetee(s) avant rendu : {chemin}", file=sys.stderr)
+        # Archive finalisee meme si le lot est interrompu : factures deja ecrites + manifeste
+        if archive is not None:
+            parties = archive.fermer()
+
+    if ignores:
+        print(f"{ignores} facture(s) inchangee(s) non regeneree(s) (--force pour tout regenerer)", file=sys.stderr)
+    if parties and args.stats:
+        print(f"Archive : {', '.join(parties)}", file=sys.stderr)
+
+    if args.stats:
+        ecoule = time.perf_counter() - debut
+        debit = compteur / ecoule if ecoule > 0 else 0.0
+        rendues = compteur - ignores
+        moyenne = duree_rendu / rendues if rendues else 0.0
+        print(
+            f"{rendues - erreurs} facture(s) generee(s), {erreurs} erreur(s) en {ecoule:.2f} s "
+            f"({debit:.1f} factures/s, {moyenne * 1000:.0f} ms/facture par processus)",
+            file=sys.stderr,
+        )
+    return 1 if erreurs else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
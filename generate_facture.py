@@ -1,70 +1,256 @@
 from docxtpl import DocxTemplate
+from docx_writer import PiecesTemplate, enregistrer_docx
+from key_normalizer import normaliser_cle
+from output_writer import EcrivainSorties, nettoyer_nom
+from xml.sax.saxutils import escape
+import copy
+import io
 import os
+import re
 import sys
 
 
-ACCENT_MAP = {
-    "é": "e",
-    "è": "e",
-    "ê": "e",
-    "ë": "e",
-    "à": "a",
-    "â": "a",
-    "ä": "a",
-    "ù": "u",
-    "û": "u",
-    "ü": "u",
-    "ï": "i",
-    "î": "i",
-    "ô": "o",
-    "ö": "o",
-    "ç": "c",
-}
-
-
-def _normalize_key(name: str) -> str:
-    base = str(name).strip().lower()
-    for accented, plain in ACCENT_MAP.items():
-        base = base.replace(accented, plain)
-    for char in (" ", "-", ".", "/", "\\"):
-        base = base.replace(char, "_")
-    return base
-
-
 def resource_path(relative_path):
     """Permet de trouver le bon chemin du template meme apres build .exe"""
     try:
         base_path = sys._MEIPASS  # PyInstaller cree ce dossier temporaire
     except Exception:
-        base_path = os.path.abspath(".")
+        # Dossier du module, pas le dossier courant (lancement par cron ou script)
+        base_path = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(base_path, relative_path)
 
 
-def generer_facture(data, dossier_sortie):
+# Rendu rapide : le XML du template est decoupe une fois en segments, sans Jinja
+RENDU_RAPIDE = True
+
+TEMPLATE_PATH = "Template/Mode\u0300le facture interne projet - V1.docx"
+
+# Cache des templates compiles : chemin -> (mtime, _TemplateCompile)
+_template_cache = {}
+
+
+_BALISE = re.compile(r"\{\{(.*?)\}\}|\{%(.*?)%\}|\{#", re.DOTALL)
+_BOUCLE = re.compile(r"^\s*for\s+(\S+)\s+in\s+(\S+)\s*$")
+_NOMS_RESERVES = {"true", "false", "none", "True", "False", "None", "loop"}
+_ECHAPPEMENT_ATTRIBUT = {'"': "&quot;"}
+_PROPRIETES = ["author", "comments", "identifier", "language", "subject", "title"]
+
+
+def _nom_simple(nom):
+    return nom.isidentifier() and nom not in _NOMS_RESERVES
+
+
+def _attribut(obj, nom):
+    """Meme resolution que Jinja pour `obj.nom` : attribut, puis cle, sinon vide."""
+    try:
+        return getattr(obj, nom)
+    except AttributeError:
+        pass
+    try:
+        return obj[nom]
+    except (TypeError, LookupError, AttributeError):
+        return ""
+
+
+def _texte(valeur, attribut):
+    if not isinstance(valeur, str):
+        valeur = str(valeur)
+    return escape(valeur, _ECHAPPEMENT_ATTRIBUT) if attribut else escape(valeur)
+
+
+class _XmlCompile:
     """
-    Remplit le template Word avec les placeholders disponibles.
-    Les nouvelles variables ajoutees dans le .docx sont initialisées a vide
-    si elles ne sont pas fournies dans les donnees.
+    XML d'une partie du document (deja passe par `patch_xml`) decoupe en
+    segments : texte litteral, variable `{{ nom }}` et boucle
+    `{% for ligne in lignes %}` avec ses champs `{{ ligne.champ }}`.
+    Seul ce sous-ensemble de Jinja est reconnu : sinon `compiler` renvoie None.
     """
-    template_path = resource_path("Template/Mode\u0300le facture interne projet - V1.docx")
-    doc = DocxTemplate(template_path)
-
-    placeholders = doc.get_undeclared_template_variables()
-    context = {}
-    for key in placeholders:
-        if key in data:
-            context[key] = data.get(key, "")
-            continue
-        normalized = _normalize_key(key)
-        if key == "lignes":
-            context[key] = data.get("lignes", [])
-        elif key == "total_ht":
-            context[key] = data.get("total_ht", 0)
+
+    def __init__(self, segments):
+        self.segments = segments
+
+    @classmethod
+    def compiler(cls, xml):
+        if "\r" in xml:
+            return None
+        segments = []
+        boucle = None
+        position = 0
+        for match in _BALISE.finditer(xml):
+            cible = boucle[3] if boucle else segments
+            if match.start() > position:
+                cible.append((0, xml[position:match.start()], None))
+            position = match.end()
+            # Variable placee dans un attribut XML : les guillemets sont aussi echappes
+            attribut = xml.rfind("<", 0, match.start()) > xml.rfind(">", 0, match.start())
+            expression, instruction = match.group(1), match.group(2)
+            if expression is not None:
+                nom, _, champ = expression.strip().partition(".")
+                if not _nom_simple(nom) or (champ and not (boucle and nom == boucle[1] and champ.isidentifier())):
+                    return None
+                if boucle and nom == boucle[1]:
+                    cible.append((3, champ or None, attribut))
+                else:
+                    cible.append((1, nom, attribut))
+            elif instruction is not None:
+                instruction = instruction.strip()
+                entete = _BOUCLE.match(instruction)
+                if entete and boucle is None and _nom_simple(entete.group(1)) and _nom_simple(entete.group(2)):
+                    boucle = (2, entete.group(1), entete.group(2), [])
+                elif instruction == "endfor" and boucle is not None:
+                    segments.append((2, boucle[2], boucle[3]))
+                    boucle = None
+                else:
+                    return None
+            else:
+                return None
+        if boucle is not None:
+            return None
+        fin = xml[position:]
+        # Jinja supprime un saut de ligne final
+        if fin.endswith("\n"):
+            fin = fin[:-1]
+        if fin:
+            segments.append((0, fin, None))
+        return cls(segments)
+
+    def rendre(self, doc, context):
+        morceaux = []
+        for genre, valeur, option in self.segments:
+            if genre == 0:
+                morceaux.append(valeur)
+            elif genre == 1:
+                morceaux.append(_texte(context.get(valeur, ""), option))
+            else:
+                for element in context.get(valeur, ()):
+                    for sous_genre, sous_valeur, sous_option in option:
+                        if sous_genre == 0:
+                            morceaux.append(sous_valeur)
+                        elif sous_genre == 1:
+                            morceaux.append(_texte(context.get(sous_valeur, ""), sous_option))
+                        elif sous_valeur is None:
+                            morceaux.append(_texte(element, sous_option))
+                        else:
+                            morceaux.append(_texte(_attribut(element, sous_valeur), sous_option))
+        xml = "".join(morceaux)
+        # Memes retouches que docxtpl apres le rendu Jinja
+        xml = re.sub(r"\n<w:p([ >])", r"<w:p\1", xml)
+        xml = xml.replace("{_{", "{{").replace("}_}", "}}").replace("{_%", "{%").replace("%_}", "%}")
+        if any(caractere in xml for caractere in "\t\n\a\f"):
+            xml = doc.resolve_listing(xml)
+        return xml
+
+
+def _compiler_rapide(doc):
+    """Compile corps, en-tetes et pieds de page pour le rendu rapide, ou None."""
+    corps = _XmlCompile.compiler(doc.patch_xml(doc.get_xml()))
+    if corps is None:
+        return None
+    parties = {}
+    for uri in (doc.HEADER_URI, doc.FOOTER_URI):
+        for rel_key, part in doc.get_headers_footers(uri):
+            xml = doc.get_part_xml(part)
+            partie = _XmlCompile.compiler(doc.patch_xml(xml))
+            if partie is None:
+                return None
+            parties[rel_key] = (partie, doc.get_headers_footers_encoding(xml))
+    for prop in _PROPRIETES:
+        valeur = getattr(doc.docx.core_properties, prop) or ""
+        if "{" in valeur or "\r" in valeur or valeur.endswith("\n"):
+            return None
+    return {"corps": corps, "parties": parties}
+
+
+class _DocxRapide(DocxTemplate):
+    """DocxTemplate dont le rendu Jinja est remplace par l'assemblage des segments compiles."""
+
+    def __init__(self, template_file, rapide):
+        super().__init__(template_file)
+        self.rapide = rapide
+
+    def build_xml(self, context, jinja_env=None):
+        return self.rapide["corps"].rendre(self, context)
+
+    def build_headers_footers_xml(self, context, uri, jinja_env=None):
+        for rel_key, part in self.get_headers_footers(uri):
+            partie, encoding = self.rapide["parties"][rel_key]
+            yield rel_key, partie.rendre(self, context).encode(encoding)
+
+    def render_properties(self, context, jinja_env=None):
+        # Proprietes sans balise (verifie a la compilation) : reecrites telles quelles,
+        # comme le fait docxtpl, pour obtenir le meme docProps/core.xml
+        proprietes = self.docx.core_properties
+        for prop in _PROPRIETES:
+            setattr(proprietes, prop, getattr(proprietes, prop))
+
+
+class _TemplateCompile:
+    """
+    Template Word charge une seule fois : document parse, variables Jinja non
+    declarees et plan placeholder -> cle de donnees (normalisation faite une fois).
+    `rapide` contient le template decoupe pour le rendu sans Jinja, ou None si
+    le template utilise des balises que ce rendu ne gere pas ; `pieces` garde
+    les parties deja compressees pour l'enregistrement.
+    """
+
+    def __init__(self, template_path):
+        with open(template_path, "rb") as f:
+            self.blob = f.read()
+        doc = DocxTemplate(io.BytesIO(self.blob))
+        self.variables = doc.get_undeclared_template_variables()
+        doc.init_docx()
+        self.docx = doc.docx
+        self.rapide = _compiler_rapide(doc)
+        self.plan = []
+        for key in sorted(self.variables):
+            if key == "lignes":
+                self.plan.append((key, key, []))
+            elif key == "total_ht":
+                self.plan.append((key, key, 0))
+            else:
+                self.plan.append((key, normaliser_cle(key), ""))
+        # Parties capturees apres un rendu a vide : pieds de page et notes sont
+        # re-serialises par docxtpl, seuls les champs remplis changent ensuite
+        echantillon = self.new_document()
+        echantillon.render(self.build_context({}))
+        self.pieces = PiecesTemplate(echantillon.docx.part.package)
+
+    def build_context(self, data):
+        context = {}
+        for key, normalized, default in self.plan:
+            if key in data:
+                context[key] = data.get(key, default)
+            else:
+                context[key] = data.get(normalized, default)
+        return context
+
+    def new_document(self, rapide=True):
+        """Copie propre en memoire du template, sans relire ni re-dezipper le .docx."""
+        if rapide and self.rapide is not None:
+            doc = _DocxRapide(io.BytesIO(self.blob), self.rapide)
         else:
-            context[key] = data.get(normalized, "")
-    doc.render(context)
+            doc = DocxTemplate(io.BytesIO(self.blob))
+        doc.docx = copy.deepcopy(self.docx)
+        return doc
+
+
+def charger_template(template_path=None):
+    """
+    Renvoie le template compile, recharge uniquement si le fichier a change
+    (cle : chemin + date de modification).
+    """
+    template_path = template_path or resource_path(TEMPLATE_PATH)
+    mtime = os.path.getmtime(template_path)
+    cached = _template_cache.get(template_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    compiled = _TemplateCompile(template_path)
+    _template_cache[template_path] = (mtime, compiled)
+    return compiled
 
-    os.makedirs(dossier_sortie, exist_ok=True)
+
+def nom_facture(data):
+    """Nom du fichier de la facture : Facture_<reference>.docx (caracteres interdits remplaces)."""
     nom_base = (
         data.get("numero_otfi")
         or data.get("code_sous_projet")
@@ -72,8 +258,40 @@ def generer_facture(data, dossier_sortie):
         or data.get("nom")
         or "Facture"
     )
-    nom_fichier = f"Facture_{nom_base}.docx"
-    chemin_fichier = os.path.join(dossier_sortie, nom_fichier)
+    return nettoyer_nom(f"Facture_{nom_base}.docx")
+
+
+def _rendre(data):
+    template = charger_template()
+    doc = template.new_document(rapide=RENDU_RAPIDE)
+    doc.render(template.build_context(data))
+    return template, doc
+
+
+def generer_facture(data, dossier_sortie, niveau_compression=None, nom_fichier=None, ecrivain=None):
+    """
+    Remplit le template Word avec les placeholders disponibles.
+    Les nouvelles variables ajoutees dans le .docx sont initialisées a vide
+    si elles ne sont pas fournies dans les donnees. Seules les parties modifiees
+    sont recompressees, au niveau zlib `niveau_compression` (defaut : 6).
+
+    Le fichier est ecrit de facon atomique (temporaire puis renommage) par
+    `ecrivain` (EcrivainSorties) ; `nom_fichier` remplace le nom par defaut
+    (nom unique reserve par le lot).
+    """
+    template, doc = _rendre(data)
+
+    if ecrivain is None:
+        ecrivain = EcrivainSorties(dossier_sortie)
+    return ecrivain.ecrire(
+        nom_fichier or nom_facture(data),
+        lambda f: enregistrer_docx(doc, f, template.pieces, niveau_compression),
+    )
+
 
-    doc.save(chemin_fichier)
-    return chemin_fichier
+def generer_facture_octets(data, niveau_compression=None):
+    """Comme `generer_facture`, sans ecrire de fichier : renvoie (nom, contenu du .docx)."""
+    template, doc = _rendre(data)
+    tampon = io.BytesIO()
+    enregistrer_docx(doc, tampon, template.pieces, niveau_compression)
+    return nom_facture(data), tampon.getvalue()
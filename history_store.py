@@ -0,0 +1,472 @@
+import json
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime
+
+
+class JsonlHistoryStore:
+    """
+    Lecture seule de l'ancien historique : journal JSON Lines (une ligne par
+    facture, {"deleted": id} par suppression) ou, a defaut, ancien history.json.
+    Ne sert plus qu'a l'import dans la base SQLite.
+    """
+
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.legacy_path = legacy_path
+
+    def load(self):
+        """Entrees vivantes du journal (ou de l'ancien history.json), dans l'ordre d'ajout."""
+        if not os.path.exists(self.path):
+            return self._load_legacy()
+        entries = {}
+        with open(self.path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    # Derniere ligne incomplete (arret brutal pendant l'ecriture) : ignoree
+                    break
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    continue
+                if "deleted" in record:
+                    entries.pop(record["deleted"], None)
+                elif "id" in record:
+                    entries[record["id"]] = record
+        return list(entries.values())
+
+    def _load_legacy(self):
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return []
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return []
+
+
+def montant_entree(meta):
+    """Montant affiche/filtre d'une entree : total_ht, a defaut somme_facture."""
+    amount = meta.get("total_ht")
+    if amount is None:
+        amount = meta.get("somme_facture", 0)
+    try:
+        return float(str(amount).replace(",", "."))
+    except Exception:
+        return 0.0
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def jour_epoch(value):
+    """Jour depuis le 01/01/1970 (entier) pour une date ou une chaine 'AAAA-MM-JJ...'."""
+    if isinstance(value, str):
+        try:
+            value = datetime.strptime(value[:10], "%Y-%m-%d").date()
+        except ValueError:
+            return None
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def trigrammes(texte):
+    """
+    Trigrammes distincts de chaque mot d'un texte deja en minuscules (les separateurs
+    -, _, ., espaces... coupent les mots, comme dans la recherche).
+    """
+    grams = set()
+    for token in re.split(r"[\W_]+", texte):
+        for i in range(len(token) - 2):
+            grams.add(token[i:i + 3])
+    return grams
+
+
+def libelle_entree(dt_str, ref, montant, file_name):
+    amount_txt = f"{montant:.2f} FCFA" if montant else "-"
+    return f"{dt_str} | {ref} | {amount_txt} | {file_name}"
+
+
+class SqliteHistoryStore:
+    """
+    Historique dans une base SQLite embarquee. Chaque entree est convertie une
+    fois, a l'insertion, en enregistrement type (jour epoch, montant numerique,
+    references, cle de recherche en minuscules, libelle) : les filtres de l'UI
+    deviennent des comparaisons numeriques sur des colonnes indexees.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY,
+            datetime TEXT NOT NULL,
+            file TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            numero_otfi TEXT NOT NULL,
+            code_sous_projet TEXT NOT NULL,
+            code_projet TEXT NOT NULL,
+            montant REAL NOT NULL,
+            meta TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_datetime ON history(datetime);
+        CREATE INDEX IF NOT EXISTS idx_history_montant ON history(montant);
+        CREATE INDEX IF NOT EXISTS idx_history_otfi ON history(numero_otfi);
+        CREATE INDEX IF NOT EXISTS idx_history_sous_projet ON history(code_sous_projet);
+        CREATE INDEX IF NOT EXISTS idx_history_projet ON history(code_projet);
+    """
+
+    # Version 2 : enregistrements types, calcules une fois a l'insertion (jour epoch,
+    # cle de recherche en minuscules, libelle d'affichage)
+    MIGRATION_V2 = """
+        ALTER TABLE history ADD COLUMN jour INTEGER;
+        ALTER TABLE history ADD COLUMN cle_recherche TEXT NOT NULL DEFAULT '';
+        ALTER TABLE history ADD COLUMN affichage TEXT NOT NULL DEFAULT '';
+        DROP INDEX IF EXISTS idx_history_date;
+        CREATE INDEX IF NOT EXISTS idx_history_jour ON history(jour);
+    """
+    # Version 3 : index inverse de trigrammes sur la cle de recherche (fichier et
+    # references) + frequence de chaque trigramme pour n'intersecter que les plus rares
+    MIGRATION_V3 = """
+        CREATE TABLE IF NOT EXISTS history_trigram (
+            gram TEXT NOT NULL,
+            entry_id INTEGER NOT NULL,
+            PRIMARY KEY (gram, entry_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS history_trigram_freq (
+            gram TEXT PRIMARY KEY,
+            n INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    """
+    # Version 4 : etat de la base (import de l'ancien historique deja fait, ...)
+    MIGRATION_V4 = """
+        CREATE TABLE IF NOT EXISTS history_meta (
+            cle TEXT PRIMARY KEY,
+            valeur TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """
+    # Version 5 : date_generation (remplacee par jour en version 2) n'est plus maintenue ;
+    # son index etait recree a chaque ouverture par l'ancien SCHEMA
+    MIGRATION_V5 = """
+        DROP INDEX IF EXISTS idx_history_date;
+        ALTER TABLE history DROP COLUMN date_generation;
+    """
+    # Version 6 : index couvrant de la cle de recherche ; une recherche trop large pour les
+    # trigrammes parcourt cet index (compact) au lieu de la table (meta JSON compris)
+    MIGRATION_V6 = """
+        CREATE INDEX IF NOT EXISTS idx_history_cle ON history(cle_recherche);
+    """
+    SCHEMA_VERSION = 6
+
+    COLUMNS = "id, datetime, file, file_name, numero_otfi, code_sous_projet, code_projet, montant, jour, affichage"
+
+    def __init__(self, path, legacy_stores=()):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._pending = None
+        self._flush_every = 500
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._migrate()
+        self._importer_historique(legacy_stores)
+
+    def _migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= self.SCHEMA_VERSION:
+            return
+        with self.conn:
+            self.conn.execute("BEGIN")
+            if version < 2:
+                self._execute_script(self.MIGRATION_V2)
+                rows = self.conn.execute("SELECT id, datetime, file, meta FROM history").fetchall()
+                for row in rows:
+                    values = self._row_values({"datetime": row["datetime"], "file": row["file"], "meta": json.loads(row["meta"])})
+                    self.conn.execute(
+                        "UPDATE history SET jour = ?, cle_recherche = ?, affichage = ? WHERE id = ?",
+                        (values[8], values[9], values[10], row["id"]),
+                    )
+            if version < 3:
+                self._execute_script(self.MIGRATION_V3)
+                for row in self.conn.execute("SELECT id, cle_recherche FROM history").fetchall():
+                    self._index_grams(row["id"], row["cle_recherche"])
+            if version < 4:
+                self._execute_script(self.MIGRATION_V4)
+            if version < 5 and self._has_column("date_generation"):
+                self._execute_script(self.MIGRATION_V5)
+            if version < 6:
+                self._execute_script(self.MIGRATION_V6)
+            self.conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _has_column(self, name):
+        return any(row["name"] == name for row in self.conn.execute("PRAGMA table_info(history)"))
+
+    def _importer_historique(self, legacy_stores):
+        """
+        Reprend l'ancien historique une seule fois : l'import est note dans
+        history_meta, une base videe ensuite par l'utilisateur reste vide.
+        Une base deja remplie (version precedente) ne reimporte rien.
+        """
+        if self.conn.execute("SELECT 1 FROM history_meta WHERE cle = 'import_historique'").fetchone():
+            return
+        entries = []
+        if self.count() == 0:
+            for legacy in legacy_stores:
+                entries = legacy.load()
+                if entries:
+                    break
+        with self.conn:
+            self._inserer(entries)
+            self.conn.execute(
+                "INSERT INTO history_meta (cle, valeur) VALUES ('import_historique', ?)", (str(len(entries)),)
+            )
+
+    def _execute_script(self, script):
+        # executescript() validerait la transaction en cours : instructions une par une
+        for statement in script.split(";"):
+            if statement.strip():
+                self.conn.execute(statement)
+
+    def _index_grams(self, entry_id, cle):
+        grams = trigrammes(cle)
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO history_trigram (gram, entry_id) VALUES (?, ?)", [(gram, entry_id) for gram in grams]
+        )
+        self.conn.executemany(
+            "INSERT INTO history_trigram_freq (gram, n) VALUES (?, 1) ON CONFLICT(gram) DO UPDATE SET n = n + 1",
+            [(gram,) for gram in grams],
+        )
+
+    def _unindex_grams(self, entry_id, cle):
+        grams = trigrammes(cle)
+        self.conn.executemany(
+            "DELETE FROM history_trigram WHERE gram = ? AND entry_id = ?", [(gram, entry_id) for gram in grams]
+        )
+        self.conn.executemany("UPDATE history_trigram_freq SET n = n - 1 WHERE gram = ?", [(gram,) for gram in grams])
+
+    def _row_values(self, entry):
+        """Forme typee d'une entree, calculee une seule fois a l'insertion."""
+        meta = entry.get("meta", {})
+        dt_str = entry.get("datetime", "")
+        file_name = os.path.basename(entry.get("file", ""))
+        numero_otfi = str(meta.get("numero_otfi", "") or "")
+        code_sous_projet = str(meta.get("code_sous_projet", "") or "")
+        code_projet = str(meta.get("code_projet", "") or "")
+        montant = montant_entree(meta)
+        ref = numero_otfi or code_sous_projet or code_projet
+        return (
+            dt_str,
+            entry.get("file", ""),
+            file_name,
+            numero_otfi,
+            code_sous_projet,
+            code_projet,
+            montant,
+            json.dumps(meta, ensure_ascii=False, default=str),
+            jour_epoch(dt_str),
+            f"{file_name} {numero_otfi} {code_sous_projet} {code_projet}".lower(),
+            libelle_entree(dt_str, ref, montant, file_name),
+        )
+
+    INSERT = (
+        "INSERT INTO history (datetime, file, file_name, numero_otfi, code_sous_projet, "
+        "code_projet, montant, meta, jour, cle_recherche, affichage) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+
+    def add(self, entry):
+        """
+        Ajoute une entree et lui attribue son id. Pendant un lot (`batch`), l'entree
+        est gardee en memoire et ecrite au prochain flush.
+        """
+        if self._pending is None:
+            self.add_many([entry])
+            return entry
+        self._pending.append(entry)
+        if len(self._pending) >= self._flush_every:
+            self.flush()
+        return entry
+
+    def begin_batch(self, flush_every=500):
+        """Demarre un lot : les ajouts sont ecrits en une transaction tous les `flush_every`."""
+        if self._pending is None:
+            self._pending = []
+        self._flush_every = max(1, flush_every)
+
+    def flush(self):
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self.add_many(pending)
+
+    def end_batch(self):
+        self.flush()
+        self._pending = None
+
+    @contextmanager
+    def batch(self, flush_every=500):
+        self.begin_batch(flush_every)
+        try:
+            yield self
+        finally:
+            self.end_batch()
+
+    def add_many(self, entries):
+        with self.conn:
+            self._inserer(entries)
+
+    def _inserer(self, entries):
+        for entry in entries:
+            values = self._row_values(entry)
+            cur = self.conn.execute(self.INSERT, values)
+            entry["id"] = cur.lastrowid
+            self._index_grams(entry["id"], values[9])
+
+    def remove(self, entry_id):
+        self.flush()
+        with self.conn:
+            row = self.conn.execute("SELECT cle_recherche FROM history WHERE id = ?", (entry_id,)).fetchone()
+            if row is None:
+                return
+            self._unindex_grams(entry_id, row["cle_recherche"])
+            self.conn.execute("DELETE FROM history WHERE id = ?", (entry_id,))
+
+    def count(self):
+        self.flush()
+        return self.conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def entries(self):
+        """Toutes les entrees au format historique (datetime, file, meta), dans l'ordre d'ajout."""
+        self.flush()
+        for row in self.conn.execute("SELECT id, datetime, file, meta FROM history ORDER BY id"):
+            yield {"id": row["id"], "datetime": row["datetime"], "file": row["file"], "meta": json.loads(row["meta"])}
+
+    ORDERS = {
+        "id": "id",
+        "date_asc": "datetime, id",
+        "date_desc": "datetime DESC, id DESC",
+        "montant_asc": "montant, id",
+        "montant_desc": "montant DESC, id DESC",
+    }
+
+    def _where(
+        self,
+        date_exacte=None,
+        date_debut=None,
+        date_fin=None,
+        montant=None,
+        montant_min=None,
+        montant_max=None,
+        titre=None,
+    ):
+        clauses = []
+        params = []
+        if date_exacte is not None:
+            clauses.append("jour = ?")
+            params.append(jour_epoch(date_exacte))
+        if date_debut is not None:
+            clauses.append("jour >= ?")
+            params.append(jour_epoch(date_debut))
+        if date_fin is not None:
+            clauses.append("jour <= ?")
+            params.append(jour_epoch(date_fin))
+        if montant is not None:
+            clauses.append("montant BETWEEN ? AND ?")
+            params.extend([montant - 0.001, montant + 0.001])
+        if montant_min is not None:
+            clauses.append("montant >= ?")
+            params.append(montant_min)
+        if montant_max is not None:
+            clauses.append("montant <= ?")
+            params.append(montant_max)
+        if titre:
+            titre = titre.lower()
+            # Candidats via l'index de trigrammes (les plus rares), verifies ensuite par LIKE ;
+            # trigrammes trop frequents : balayage de l'index de la cle dans ce cas
+            grams = self._rarest_grams(titre)
+            if grams:
+                subquery = " INTERSECT ".join(["SELECT entry_id FROM history_trigram WHERE gram = ?"] * len(grams))
+                clauses.append(f"id IN ({subquery})")
+                params.extend(grams)
+            pattern = "%" + titre.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            clauses.append("cle_recherche LIKE ? ESCAPE '\\'")
+            params.append(pattern)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _rarest_grams(self, titre, limit=3, max_ratio=0.1, candidats=100):
+        """
+        Trigrammes de la recherche a intersecter dans l'index, les moins frequents d'abord
+        (`limit` au plus). Les listes lues doivent couvrir ensemble au plus `max_ratio` des
+        entrees : une entree lue dans l'index coute plusieurs fois une entree du balayage
+        de idx_history_cle, au-dela le balayage est plus rapide (vide dans ce cas). L'ajout
+        s'arrete des qu'il reste environ `candidats` entrees a verifier.
+        """
+        grams = trigrammes(titre)
+        total = self._total()
+        if not grams or not total:
+            return []
+        placeholders = ", ".join("?" * len(grams))
+        freqs = dict(
+            self.conn.execute(f"SELECT gram, n FROM history_trigram_freq WHERE gram IN ({placeholders})", list(grams))
+        )
+        retenus = []
+        lus = 0
+        estime = total
+        for n, gram in sorted((freqs.get(gram, 0), gram) for gram in grams)[:limit]:
+            lus += n
+            if lus > max_ratio * total:
+                break
+            retenus.append(gram)
+            # Estimation (trigrammes independants) : sous-estime pour des trigrammes d'un meme mot
+            estime = estime * n / total
+            if estime <= candidats:
+                break
+        return retenus
+
+    def _total(self):
+        # MAX(id) : majorant immediat du nombre d'entrees (COUNT(*) parcourt toute la table)
+        return self.conn.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0
+
+    def count_matching(self, **filters):
+        self.flush()
+        where, params = self._where(**filters)
+        return self.conn.execute("SELECT COUNT(*) FROM history" + where, params).fetchone()[0]
+
+    def search(self, order="id", limit=None, offset=0, **filters):
+        """
+        Renvoie les lignes (sqlite3.Row) correspondant aux filtres (date_exacte, date_debut,
+        date_fin : objets date ; montant, montant_min, montant_max : floats ; titre), triees
+        selon `order` (cle de ORDERS). `limit`/`offset` permettent de ne lire qu'une fenetre.
+        """
+        self.flush()
+        where, params = self._where(**filters)
+        sql = f"SELECT {self.COLUMNS} FROM history{where} ORDER BY {self.ORDERS[order]}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [limit, offset]
+        return self.conn.execute(sql, params).fetchall()
+
+    def search_keys(self, order="id", limit=None, **filters):
+        """
+        (id, cle_recherche) des entrees correspondantes, triees selon `order`. Renvoie None
+        si plus de `limit` resultats (ensemble trop grand pour etre affine en memoire).
+        """
+        self.flush()
+        where, params = self._where(**filters)
+        # Test de depassement sans tri ni lecture des cles : s'arrete a la (limit + 1)-ieme entree
+        if limit is not None and self.conn.execute(
+            f"SELECT 1 FROM history{where} LIMIT 1 OFFSET ?", params + [limit]
+        ).fetchone():
+            return None
+        # Filtre d'abord (index de la cle, des dates...), puis tri des seules entrees retenues
+        sql = f"SELECT id, cle_recherche FROM history WHERE id IN (SELECT id FROM history{where}) ORDER BY {self.ORDERS[order]}"
+        return [(row["id"], row["cle_recherche"]) for row in self.conn.execute(sql, params)]
+
+    def rows_by_ids(self, ids):
+        """Lignes completes pour une liste d'ids, dans l'ordre de la liste."""
+        if not ids:
+            return []
+        placeholders = ", ".join("?" * len(ids))
+        rows = {row["id"]: row for row in self.conn.execute(
+            f"SELECT {self.COLUMNS} FROM history WHERE id IN ({placeholders})", list(ids)
+        )}
+        return [rows[entry_id] for entry_id in ids if entry_id in rows]
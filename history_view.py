@@ -0,0 +1,139 @@
+import tkinter as tk
+import tkinter.font as tkfont
+
+
+class VirtualHistoryList(tk.Frame):
+    """
+    Liste virtualisee pour l'historique : seules les lignes visibles (plus une
+    petite marge) sont lues, formatees et inserees dans la Listbox. La barre de
+    defilement represente l'ensemble des resultats ; les lignes sont demandees
+    par fenetre a `fetch(offset, limit)` au fil du defilement.
+    """
+
+    def __init__(self, master, format_row, buffer=40, font=None, min_rows=8, **kwargs):
+        super().__init__(master, **kwargs)
+        self.format_row = format_row
+        self.buffer = buffer
+        self.min_rows = min_rows
+        self.fetch = None
+        self.total = 0
+        self.offset = 0
+        self.cache_start = 0
+        self.cache_rows = []
+        self.window_ids = []
+        self.selected_id = None
+
+        self.listbox = tk.Listbox(self, height=min_rows, font=font, activestyle="dotbox", exportselection=False)
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.listbox.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.line_height = max(tkfont.Font(font=font or self.listbox.cget("font")).metrics("linespace"), 1)
+
+        self.listbox.bind("<Configure>", lambda event: self._render())
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<MouseWheel>", self._on_mousewheel)
+        self.listbox.bind("<Button-4>", lambda event: self._scroll_by(-3))
+        self.listbox.bind("<Button-5>", lambda event: self._scroll_by(3))
+        self.listbox.bind("<Up>", lambda event: self._move_selection(-1))
+        self.listbox.bind("<Down>", lambda event: self._move_selection(1))
+        self.listbox.bind("<Prior>", lambda event: self._scroll_by(-self.visible_rows()))
+        self.listbox.bind("<Next>", lambda event: self._scroll_by(self.visible_rows()))
+
+    def set_source(self, total, fetch):
+        """Nouvelle source de donnees (apres filtre/tri) : `total` lignes, lues via `fetch`."""
+        self.total = total
+        self.fetch = fetch
+        self.offset = min(self.offset, max(total - self.visible_rows(), 0))
+        self.cache_start = 0
+        self.cache_rows = []
+        self._render()
+
+    def get_selected_id(self):
+        """Id de la ligne selectionnee et visible, sinon None."""
+        selection = self.listbox.curselection()
+        if selection and selection[0] < len(self.window_ids):
+            return self.window_ids[selection[0]]
+        return None
+
+    def visible_rows(self):
+        height = self.listbox.winfo_height()
+        if height <= 1:
+            return self.min_rows
+        return max(height // self.line_height, 1)
+
+    def _rows(self, start, count):
+        """Lignes [start, start + count) depuis le cache, recharge avec marge si besoin."""
+        end = min(start + count, self.total)
+        cache_end = self.cache_start + len(self.cache_rows)
+        if start < self.cache_start or end > cache_end:
+            self.cache_start = max(start - self.buffer, 0)
+            limit = (end - self.cache_start) + self.buffer
+            self.cache_rows = list(self.fetch(self.cache_start, limit)) if self.fetch else []
+        return self.cache_rows[start - self.cache_start:end - self.cache_start]
+
+    def _render(self):
+        rows_count = self.visible_rows()
+        self.offset = max(0, min(self.offset, self.total - rows_count))
+        rows = self._rows(self.offset, rows_count + 1) if self.total else []
+
+        self.listbox.delete(0, "end")
+        self.window_ids = []
+        for row in rows:
+            self.listbox.insert("end", self.format_row(row))
+            self.window_ids.append(row["id"])
+        if self.selected_id in self.window_ids:
+            self.listbox.selection_set(self.window_ids.index(self.selected_id))
+
+        if self.total:
+            first = self.offset / self.total
+            last = min((self.offset + rows_count) / self.total, 1.0)
+        else:
+            first, last = 0.0, 1.0
+        self.scrollbar.set(first, last)
+
+    def _scroll_by(self, delta):
+        self.offset += delta
+        self._render()
+        return "break"
+
+    def _move_selection(self, delta):
+        """Fleches : deplace la selection d'une ligne et fait defiler pour la garder visible."""
+        if not self.total:
+            return "break"
+        if self.selected_id in self.window_ids:
+            position = self.offset + self.window_ids.index(self.selected_id) + delta
+        else:
+            # Aucune ligne selectionnee a l'ecran : on part de la premiere ligne visible
+            position = self.offset
+        position = max(0, min(position, self.total - 1))
+        rows_count = self.visible_rows()
+        if position < self.offset:
+            self.offset = position
+        elif position >= self.offset + rows_count:
+            self.offset = position - rows_count + 1
+        self._render()
+        index = position - self.offset
+        if index < len(self.window_ids):
+            self.selected_id = self.window_ids[index]
+            self.listbox.selection_clear(0, "end")
+            self.listbox.selection_set(index)
+            self.listbox.activate(index)
+            self.listbox.event_generate("<<ListboxSelect>>")
+        return "break"
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.offset = int(float(value) * self.total)
+            self._render()
+        elif action == "scroll":
+            step = int(value) * (self.visible_rows() if unit == "pages" else 1)
+            self._scroll_by(step)
+
+    def _on_mousewheel(self, event):
+        # Windows : delta par pas de 120
+        return self._scroll_by(int(-1 * (event.delta / 120)) * 3)
+
+    def _on_select(self, event):
+        selection = self.listbox.curselection()
+        if selection and selection[0] < len(self.window_ids):
+            self.selected_id = self.window_ids[selection[0]]
@@ -0,0 +1,35 @@
+import re
+from functools import lru_cache
+
+
+ACCENT_MAP = {
+    "é": "e",
+    "è": "e",
+    "ê": "e",
+    "ë": "e",
+    "à": "a",
+    "â": "a",
+    "ä": "a",
+    "ù": "u",
+    "û": "u",
+    "ü": "u",
+    "ï": "i",
+    "î": "i",
+    "ô": "o",
+    "ö": "o",
+    "ç": "c",
+}
+
+_SANS_ACCENTS = str.maketrans(ACCENT_MAP)
+_SEPARATEURS = re.compile(r"[^a-z0-9]+")
+
+
+@lru_cache(maxsize=4096)
+def normaliser_cle(name):
+    """
+    Forme commune des noms de colonnes Excel et des variables du template :
+    minuscules, accents retires, tout autre caractere -> underscore (sans
+    underscore en debut ni en fin). Resultat memorise par nom.
+    """
+    base = str(name).strip().lower().translate(_SANS_ACCENTS)
+    return _SEPARATEURS.sub("_", base).strip("_")
@@ -1,7 +1,10 @@
 import os
-import json
+import multiprocessing
+import queue
+import threading
+import time
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 from datetime import date, datetime
 import pandas as pd
 try:
@@ -14,8 +17,15 @@ try:
 except ImportError:
     Calendar = None
 
-from excel_loader import charger_donnees_excel
+from batch_generator import iterer_lot, position_resultat
+from checkpoint import PointReprise, derniere_position
+from excel_loader import charger_donnees_excel, compter_lignes_excel
 from generate_facture import generer_facture
+from history_store import JsonlHistoryStore, SqliteHistoryStore
+from history_view import VirtualHistoryList
+from output_manifest import ManifesteSortie
+from rejects_report import RapportRejets, chemin_rejets
+from source_loader import charger_sources, compter_sources, lister_sources
 
 # Palette et polices pour un rendu plus propre
 COLORS = {
@@ -35,17 +45,17 @@ ENTRY_FONT = ("Segoe UI", 10)
 BUTTON_FONT = ("Segoe UI", 10, "bold")
 
 APP_DIR = os.path.abspath(os.path.dirname(__file__))
-HISTORY_PATH = os.path.join(APP_DIR, "data", "history.json")
-
-root = tk.Tk()
-root.title("Facture interne projet V1")
-root.geometry("900x780")
-root.minsize(760, 700)
-root.configure(bg=COLORS["bg"])
-root.resizable(True, True)
-
-dossier_sortie = tk.StringVar(value="")
-status_message = tk.StringVar(value="Choisissez un dossier de sortie pour commencer.")
+HISTORY_PATH = os.path.join(APP_DIR, "data", "history.sqlite3")
+JOURNAL_HISTORY_PATH = os.path.join(APP_DIR, "data", "history.jsonl")
+LEGACY_HISTORY_PATH = os.path.join(APP_DIR, "data", "history.json")
+
+# Fenetre et widgets partages, crees par main() : rien n'est construit a l'import
+# (les processus du pool reimportent ce module avec la methode spawn)
+root: tk.Tk
+dossier_sortie: tk.StringVar
+excel_force: tk.BooleanVar
+excel_toutes_feuilles: tk.BooleanVar
+status_message: tk.StringVar
 label_dossier_value: tk.Label
 header_subtitle: tk.Label
 home_subtitle: tk.Label
@@ -57,8 +67,15 @@ logo_image = None
 ligne_entries = []
 entry_date_emission: tk.Entry
 entry_date_du_jour: tk.Entry
-history_listbox: tk.Listbox
-history_data = []
+history_view: VirtualHistoryList
+history_store: SqliteHistoryStore
+history_sort: tk.StringVar
+# Filtrage en direct : delai de saisie et resultats courants affinables en memoire
+HISTORY_DEBOUNCE_MS = 250
+HISTORY_LIVE_LIMIT = 20000
+# Generation par lot : l'historique en attente est ecrit au moins toutes les HISTORY_FLUSH_SECONDES
+HISTORY_FLUSH_SECONDES = 1.0
+history_live = {"after_id": None, "filters": None, "titre": "", "candidats": None}
 history_filter_start: tk.Entry
 history_filter_end: tk.Entry
 history_filter_amount_min: tk.Entry
@@ -67,6 +84,12 @@ history_filter_mode: tk.StringVar
 history_filter_date: tk.Entry
 history_filter_amount: tk.Entry
 history_filter_title: tk.Entry
+excel_generate_button: tk.Button
+excel_cancel_button: tk.Button
+excel_progress: ttk.Progressbar
+generation_annulation = threading.Event()
+generation_queue = queue.Queue()
+generation_state = {}
 
 
 # Utilitaires
@@ -97,48 +120,43 @@ def load_logo():
         return None
 
 
-def load_history():
-    if not os.path.exists(HISTORY_PATH):
-        return []
-    try:
-        with open(HISTORY_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
-
+def load_history() -> SqliteHistoryStore:
+    """Ouvre la base d'historique ; au premier lancement, reprend le journal JSONL ou l'ancien JSON."""
+    legacy = JsonlHistoryStore(JOURNAL_HISTORY_PATH, legacy_path=LEGACY_HISTORY_PATH)
+    return SqliteHistoryStore(HISTORY_PATH, legacy_stores=[legacy])
 
-def save_history(data_list):
-    os.makedirs(os.path.dirname(HISTORY_PATH), exist_ok=True)
-    with open(HISTORY_PATH, "w", encoding="utf-8") as f:
-        json.dump(data_list, f, ensure_ascii=False, indent=2)
 
-
-def add_history_entry(path: str, meta: dict):
+def add_history_entry(path: str, meta: dict, refresh: bool = True):
+    """
+    Enregistre une facture dans l'historique. En generation par lot, passer
+    refresh=False (dans un history_store.begin_batch/end_batch) et rafraichir une fois a la fin.
+    """
     entry = {
         "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "file": path,
         "meta": meta,
     }
-    history_data.append(entry)
-    save_history(history_data)
-    refresh_history_ui()
+    history_store.add(entry)
+    history_live["candidats"] = None
+    if refresh:
+        refresh_history_ui()
 
 
 def remove_history_selected():
-    selection = history_listbox.curselection()
-    if not selection:
+    entry_id = history_view.get_selected_id()
+    if entry_id is None:
         return
-    idx = selection[0]
-    if idx < 0 or idx >= len(history_data):
-        return
-    del history_data[idx]
-    save_history(history_data)
+    history_store.remove(entry_id)
+    history_live["candidats"] = None
     refresh_history_ui()
 
 
+def format_history_row(row) -> str:
+    # Libelle precalcule a l'insertion dans la base
+    return row["affichage"]
+
+
 def refresh_history_ui():
-    history_listbox.delete(0, "end")
-    mode = history_filter_mode.get() if history_filter_mode else ""
     date_exacte = history_filter_date.get().strip() if history_filter_date else ""
     start_val = history_filter_start.get().strip() if history_filter_start else ""
     end_val = history_filter_end.get().strip() if history_filter_end else ""
@@ -159,53 +177,52 @@ def refresh_history_ui():
         except Exception:
             return None
 
-    date_target = parse_filter_date(date_exacte) if date_exacte else None
-    start_date = parse_filter_date(start_val) if start_val else None
-    end_date = parse_filter_date(end_val) if end_val else None
-    amount_target = parse_amount(amount_exact) if amount_exact else None
-    min_amount = parse_amount(min_val) if min_val else None
-    max_amount = parse_amount(max_val) if max_val else None
-
-    for entry in history_data:
-        file_name = os.path.basename(entry.get("file", ""))
-        dt_str = entry.get("datetime", "")
-        try:
-            dt_obj = datetime.strptime(dt_str, "%Y-%m-%d %H:%M:%S").date()
-        except Exception:
-            dt_obj = None
-
-        if start_date and dt_obj and dt_obj < start_date:
-            continue
-        if end_date and dt_obj and dt_obj > end_date:
-            continue
-        if date_target and dt_obj and dt_obj != date_target:
-            continue
-
-        meta = entry.get("meta", {})
-        amount = meta.get("total_ht")
-        if amount is None:
-            amount = meta.get("somme_facture", 0)
-        try:
-            amount_val = float(str(amount).replace(",", "."))
-        except Exception:
-            amount_val = 0.0
-
-        if amount_target is not None and abs(amount_val - amount_target) > 0.001:
-            continue
-        if min_amount is not None and amount_val < min_amount:
-            continue
-        if max_amount is not None and amount_val > max_amount:
-            continue
+    filters = {
+        "date_exacte": parse_filter_date(date_exacte) if date_exacte else None,
+        "date_debut": parse_filter_date(start_val) if start_val else None,
+        "date_fin": parse_filter_date(end_val) if end_val else None,
+        "montant": parse_amount(amount_exact) if amount_exact else None,
+        "montant_min": parse_amount(min_val) if min_val else None,
+        "montant_max": parse_amount(max_val) if max_val else None,
+        "titre": title_val,
+    }
+    order = history_sort.get()
+    live = history_live
+    if live["after_id"] is not None:
+        root.after_cancel(live["after_id"])
+        live["after_id"] = None
+
+    # Recherche prolongee (meme filtres, titre qui contient le precedent) : on affine
+    # les resultats courants en memoire au lieu de relancer une requete complete
+    other_filters = (order, {k: v for k, v in filters.items() if k != "titre"})
+    candidats = live["candidats"]
+    if candidats is not None and live["filters"] == other_filters and live["titre"] and live["titre"] in title_val:
+        candidats = [(entry_id, cle) for entry_id, cle in candidats if title_val in cle]
+    elif title_val:
+        candidats = history_store.search_keys(order=order, limit=HISTORY_LIVE_LIMIT, **filters)
+    else:
+        # Sans recherche titre, rien a affiner a la frappe suivante : comptage + fenetre visible
+        candidats = None
+    live.update({"filters": other_filters, "titre": title_val, "candidats": candidats})
+
+    # Seule la fenetre visible est lue et formatee par la liste virtualisee
+    if candidats is not None:
+        history_view.set_source(
+            len(candidats),
+            lambda offset, limit: history_store.rows_by_ids([entry_id for entry_id, _ in candidats[offset:offset + limit]]),
+        )
+    else:
+        history_view.set_source(
+            history_store.count_matching(**filters),
+            lambda offset, limit: history_store.search(order=order, limit=limit, offset=offset, **filters),
+        )
 
-        if title_val:
-            search_zone = f"{file_name} {meta.get('numero_otfi','')} {meta.get('code_sous_projet','')} {meta.get('code_projet','')}".lower()
-            if title_val not in search_zone:
-                continue
 
-        ref = meta.get("numero_otfi") or meta.get("code_sous_projet") or meta.get("code_projet") or ""
-        amount_txt = f"{amount_val:.2f} FCFA" if amount_val else "-"
-        display = f"{dt_str} | {ref} | {amount_txt} | {file_name}"
-        history_listbox.insert("end", display)
+def schedule_history_refresh(event=None):
+    """Filtrage a la frappe : la requete part apres une courte pause, les frappes intermediaires l'annulent."""
+    if history_live["after_id"] is not None:
+        root.after_cancel(history_live["after_id"])
+    history_live["after_id"] = root.after(HISTORY_DEBOUNCE_MS, refresh_history_ui)
 
 
 def apply_history_filter():
@@ -231,7 +248,7 @@ def clear_history_filter():
 
 def export_history_excel():
     """Exporte l'historique des factures en Excel."""
-    if not history_data:
+    if not history_store.count():
         messagebox.showinfo("Historique", "Aucune facture dans l'historique.")
         return
 
@@ -245,7 +262,7 @@ def export_history_excel():
         return
 
     rows = []
-    for entry in history_data:
+    for entry in history_store.entries():
         meta = entry.get("meta", {})
         amount = meta.get("total_ht")
         if amount is None:
@@ -269,17 +286,8 @@ def export_history_excel():
         messagebox.showerror("Erreur", f"Impossible d'exporter :\n{e}")
 
 
-def export_excel_template():
-    """Genere un fichier Excel vierge avec les colonnes attendues."""
-    path = filedialog.asksaveasfilename(
-        title="Enregistrer le template Excel",
-        defaultextension=".xlsx",
-        filetypes=[("Excel", "*.xlsx")],
-        initialfile="template_factures.xlsx",
-    )
-    if not path:
-        return
-
+def ecrire_template_excel(path: str) -> None:
+    """Ecrit le template d'import (feuilles Factures et Lignes) avec une facture d'exemple valide."""
     colonnes = [
         "code_projet",
         "code_sous_projet",
@@ -294,17 +302,16 @@ def export_excel_template():
         "somme_facture",
     ]
 
-    # Colonnes pour 5 lignes de prestation
-    for idx in range(1, 6):
-        colonnes.extend(
-            [
-                f"ligne{idx}_designation",
-                f"ligne{idx}_type_prestation",
-                f"ligne{idx}_unite",
-                f"ligne{idx}_quantite",
-                f"ligne{idx}_prix_unitaire",
-            ]
-        )
+    # Lignes de prestation au format long : une ligne Excel par prestation,
+    # rattachee a sa facture par numero_otfi (nombre de lignes illimite)
+    colonnes_lignes = [
+        "numero_otfi",
+        "designation",
+        "type_prestation",
+        "unite",
+        "quantite",
+        "prix_unitaire",
+    ]
 
     exemple = {
         "code_projet": "PRJ-001",
@@ -317,26 +324,32 @@ def export_excel_template():
         "date_emission": "01/01/2025",
         "date_du_jour": "01/01/2025",
         "periode_concernee": "Janvier 2025",
-        "somme_facture": 120000,
+        # Egale au total des lignes : l'exemple passe le controle avant rendu
+        "somme_facture": 175000,
     }
-    exemple.update(
-        {
-            "ligne1_designation": "Prestation A",
-            "ligne1_type_prestation": "Service",
-            "ligne1_unite": "Lot",
-            "ligne1_quantite": 2,
-            "ligne1_prix_unitaire": 50000,
-            "ligne2_designation": "Prestation B",
-            "ligne2_type_prestation": "Support",
-            "ligne2_unite": "H",
-            "ligne2_quantite": 5,
-            "ligne2_prix_unitaire": 15000,
-        }
+    exemple_lignes = [
+        ["OTFI-2025-001", "Prestation A", "Service", "Lot", 2, 50000],
+        ["OTFI-2025-001", "Prestation B", "Support", "H", 5, 15000],
+    ]
+
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        pd.DataFrame([exemple], columns=colonnes).to_excel(writer, sheet_name="Factures", index=False)
+        pd.DataFrame(exemple_lignes, columns=colonnes_lignes).to_excel(writer, sheet_name="Lignes", index=False)
+
+
+def export_excel_template():
+    """Genere un fichier Excel vierge avec les colonnes attendues."""
+    path = filedialog.asksaveasfilename(
+        title="Enregistrer le template Excel",
+        defaultextension=".xlsx",
+        filetypes=[("Excel", "*.xlsx")],
+        initialfile="template_factures.xlsx",
     )
+    if not path:
+        return
 
-    df = pd.DataFrame([exemple], columns=colonnes)
     try:
-        df.to_excel(path, index=False)
+        ecrire_template_excel(path)
         messagebox.showinfo("Template Excel", f"Template enregistre :\n{path}")
     except Exception as e:
         messagebox.showerror("Erreur", f"Impossible de sauvegarder le template :\n{e}")
@@ -480,26 +493,234 @@ def generer_manuel() -> None:
     messagebox.showinfo("Facture generee", f"Facture enregistree dans :\n{chemin}")
 
 
+def _format_duree(secondes: float) -> str:
+    secondes = int(secondes)
+    if secondes >= 60:
+        return f"{secondes // 60} min {secondes % 60:02d} s"
+    return f"{secondes} s"
+
+
+def _generation_worker(
+    fichiers: list, toutes_feuilles: bool, dossier: str, force: bool, reprise: PointReprise, depart: int
+) -> None:
+    """Thread de fond : pilote le pool de rendu et transmet les resultats a l'UI via la queue."""
+    termine = False
+    rejets = None
+    try:
+        manifeste = ManifesteSortie(dossier, force=force)
+        rapport = RapportRejets(chemin_rejets(dossier))
+        if depart:
+            rapport.reprendre()
+        if len(fichiers) > 1 or toutes_feuilles:
+            records = charger_sources(fichiers, toutes_feuilles)
+        else:
+            records = charger_donnees_excel(fichiers[0], streaming=True)
+        resultats = iterer_lot(
+            records, dossier, annulation=generation_annulation, ignorer=manifeste.a_jour, depart=depart
+        )
+        try:
+            for resultat in resultats:
+                rapport.noter(resultat["data"])
+                if not resultat["erreur"] and not resultat["ignore"]:
+                    manifeste.enregistrer(resultat["data"], resultat["chemin"])
+                reprise.avancer(resultat["index"], resultat["chemin"], erreur=bool(resultat["erreur"]), data=resultat["data"])
+                generation_queue.put(("resultat", resultat))
+            termine = not generation_annulation.is_set()
+        finally:
+            manifeste.sauver()
+            rejets = rapport.fermer()
+            # Lot annule ou interrompu : le point de reprise permet de continuer plus tard
+            if termine:
+                reprise.terminer()
+            else:
+                reprise.sauver()
+        generation_queue.put(("fin", rejets))
+    except Exception as e:
+        generation_queue.put(("echec", str(e)))
+
+
+def _poll_generation() -> None:
+    """Depile les resultats du thread de fond (dans le thread Tk) et met a jour l'UI."""
+    state = generation_state
+    fin = None
+    # Nombre de messages borne par passage pour garder la fenetre reactive
+    for _ in range(200):
+        try:
+            kind, payload = generation_queue.get_nowait()
+        except queue.Empty:
+            break
+        if kind != "resultat":
+            fin = (kind, payload)
+            break
+        state["traites"] += 1
+        if payload["ignore"]:
+            state["ignores"] += 1
+        elif payload["erreur"]:
+            state["erreurs"].append(f"{position_resultat(payload)} : {payload['erreur']}")
+        else:
+            add_history_entry(payload["chemin"], payload["data"], refresh=False)
+            state["compteur"] += 1
+    # Les factures deja ecrites sur disque ne doivent pas attendre la fin du lot pour etre historisees
+    if time.monotonic() - state["dernier_flush"] >= HISTORY_FLUSH_SECONDES:
+        history_store.flush()
+        state["dernier_flush"] = time.monotonic()
+
+    traites = state["traites"]
+    total = state["total"]
+    ecoule = time.monotonic() - state["debut"]
+    debit = (traites - state["depart"]) / ecoule if ecoule > 0 else 0.0
+    if total:
+        excel_progress.configure(maximum=max(total, traites), value=traites)
+    message = f"Generation en cours : {traites}" + (f"/{total}" if total else "") + f" ligne(s), {debit:.1f} factures/s"
+    if total and debit > 0 and traites < total:
+        message += f", fin estimee dans {_format_duree((total - traites) / debit)}"
+    if state["fermeture"]:
+        message += " - fermeture apres les factures en cours..."
+    elif generation_annulation.is_set():
+        message += " - annulation apres les factures en cours..."
+    set_status(message)
+
+    if fin is None:
+        root.after(100, _poll_generation)
+        return
+    _terminer_generation(*fin)
+
+
+def _terminer_generation(kind: str, payload) -> None:
+    state = generation_state
+    state["en_cours"] = False
+    history_store.end_batch()
+    if state["fermeture"]:
+        root.destroy()
+        return
+    refresh_history_ui()
+    excel_progress.stop()
+    excel_progress.configure(mode="determinate", value=0)
+    excel_generate_button.config(state="normal")
+    excel_cancel_button.config(state="disabled")
+
+    compteur = state["compteur"]
+    erreurs = state["erreurs"]
+    ignores = state["ignores"]
+    nom_fichier = ", ".join(os.path.basename(fichier) for fichier in state["fichiers"])
+    detail_ignores = f"\n{ignores} facture(s) inchangee(s) non regeneree(s)." if ignores else ""
+    if kind == "fin" and payload:
+        detail_ignores += f"\nLignes rejetees avant rendu : voir {payload}"
+    if kind == "echec":
+        set_status(f"Generation interrompue : {payload}")
+        messagebox.showerror("Erreur", f"La generation a echoue apres {compteur} facture(s) :\n{payload}")
+        return
+    if generation_annulation.is_set():
+        set_status(f"Generation annulee : {compteur} facture(s) generee(s) depuis {nom_fichier}.")
+        messagebox.showinfo(
+            "Annule",
+            f"Generation annulee apres {compteur} facture(s).\n"
+            "Relancez l'import du meme fichier pour reprendre a la premiere ligne non traitee.",
+        )
+        return
+
+    set_status(
+        f"{compteur} facture(s) generee(s) depuis {nom_fichier}"
+        + (f", {ignores} inchangee(s) ignoree(s)." if ignores else ".")
+    )
+    if erreurs:
+        detail = "\n".join(erreurs[:10])
+        if len(erreurs) > 10:
+            detail += f"\n... et {len(erreurs) - 10} autre(s)"
+        messagebox.showwarning(
+            "Termine avec erreurs",
+            f"{compteur} facture(s) generee(s), {len(erreurs)} en erreur :\n{detail}{detail_ignores}",
+        )
+    else:
+        messagebox.showinfo("Termine", f"Toutes les factures ont ete generees ({compteur}).{detail_ignores}")
+
+
+def annuler_generation() -> None:
+    generation_annulation.set()
+    excel_cancel_button.config(state="disabled")
+    set_status("Annulation demandee : arret apres les factures en cours...")
+
+
+def fermer_application() -> None:
+    """
+    Fermeture de la fenetre. Pendant une generation : annulation, ecriture de
+    l'historique en attente, puis fermeture une fois les factures en cours
+    terminees et historisees. Un second clic ferme immediatement.
+    """
+    state = generation_state
+    if not state.get("en_cours") or state["fermeture"]:
+        history_store.end_batch()
+        root.destroy()
+        return
+    state["fermeture"] = True
+    annuler_generation()
+    history_store.end_batch()
+    set_status("Fermeture apres les factures en cours...")
+
+
 def generer_depuis_excel() -> None:
     if not require_dossier():
         return
 
-    fichier_excel = filedialog.askopenfilename(
-        title="Selectionner le fichier Excel",
-        filetypes=[("Excel", "*.xlsx")],
-    )
-    if not fichier_excel:
+    fichiers = list(filedialog.askopenfilenames(
+        title="Selectionner le ou les fichiers Excel",
+        filetypes=[("Excel ou CSV", "*.xlsx *.csv *.tsv *.txt"), ("Excel", "*.xlsx"), ("CSV / TSV", "*.csv *.tsv *.txt")],
+    ))
+    if not fichiers:
         set_status("Generation annulee : aucun fichier Excel selectionne.")
         return
+    toutes_feuilles = excel_toutes_feuilles.get()
+    multi_sources = len(fichiers) > 1 or toutes_feuilles
+
+    try:
+        if multi_sources:
+            total = compter_sources(lister_sources(fichiers, toutes_feuilles))
+        else:
+            total = compter_lignes_excel(fichiers[0])
+    except Exception:
+        total = None
 
-    compteur = 0
-    for data in charger_donnees_excel(fichier_excel):
-        chemin = generer_facture(data, dossier_sortie.get())
-        add_history_entry(chemin, data)
-        compteur += 1
+    dossier = dossier_sortie.get()
+    try:
+        reprise = PointReprise(dossier, fichiers if multi_sources else fichiers[0])
+    except OSError as e:
+        messagebox.showerror("Erreur", f"Impossible de lire le fichier Excel :\n{e}")
+        return
+    depart = 0
+    etat = reprise.charger()
+    if etat is not None and messagebox.askyesno(
+        "Reprendre la generation",
+        f"Une generation precedente de ce fichier s'est arretee apres la {derniere_position(etat)} "
+        f"({len(etat['sorties'])} facture(s) generee(s)).\n\n"
+        "Reprendre a partir de la ligne suivante ?\n(Non : tout reprendre depuis le debut)",
+    ):
+        depart = reprise.reprendre(etat)
+
+    generation_state.clear()
+    generation_state.update(
+        {
+            "fichiers": fichiers, "total": total, "traites": depart, "compteur": 0, "ignores": 0,
+            "erreurs": [], "debut": time.monotonic(), "depart": depart,
+            "en_cours": True, "fermeture": False, "dernier_flush": time.monotonic(),
+        }
+    )
+    generation_annulation.clear()
+    history_store.begin_batch()
+    if total:
+        excel_progress.configure(mode="determinate", maximum=total, value=depart)
+    else:
+        excel_progress.configure(mode="indeterminate")
+        excel_progress.start(15)
+    excel_generate_button.config(state="disabled")
+    excel_cancel_button.config(state="normal")
+    set_status(f"Generation en cours depuis {', '.join(os.path.basename(fichier) for fichier in fichiers)}...")
 
-    set_status(f"{compteur} facture(s) generee(s) depuis {os.path.basename(fichier_excel)}.")
-    messagebox.showinfo("Termine", f"Toutes les factures ont ete generees ({compteur}).")
+    threading.Thread(
+        target=_generation_worker,
+        args=(fichiers, toutes_feuilles, dossier, excel_force.get(), reprise, depart),
+        daemon=True,
+    ).start()
+    root.after(100, _poll_generation)
 
 
 # Navigation entre ecrans
@@ -511,81 +732,6 @@ def show_frame(frame: tk.Frame) -> None:
 
 
 # Habillage principal
-container = tk.Frame(root, bg=COLORS["bg"])
-container.pack(fill="both", expand=True, padx=20, pady=20)
-
-header = tk.Frame(container, bg=COLORS["bg"])
-header.pack(fill="x")
-logo_image = load_logo()
-header_row = tk.Frame(header, bg=COLORS["bg"])
-header_row.pack(fill="x")
-if logo_image:
-    tk.Label(header_row, image=logo_image, bg=COLORS["bg"]).pack(side="left", padx=(0, 12))
-else:
-    tk.Label(header_row, text="INGRID", font=("Segoe UI", 12, "bold"), bg=COLORS["bg"], fg=COLORS["text"]).pack(
-        side="left", padx=(0, 12)
-    )
-titles = tk.Frame(header_row, bg=COLORS["bg"])
-titles.pack(side="left", fill="x", expand=True)
-tk.Label(titles, text="Facture Interne Projet - Generator V1", font=TITLE_FONT, bg=COLORS["bg"], fg=COLORS["text"]).pack(anchor="w")
-header_subtitle = tk.Label(
-    titles,
-    text="Assistant de generation de factures base sur votre template Word.",
-    font=SUBTITLE_FONT,
-    bg=COLORS["bg"],
-    fg=COLORS["muted"],
-)
-header_subtitle.pack(anchor="w", pady=(2, 12))
-
-output_card = tk.Frame(
-    container,
-    bg=COLORS["card"],
-    bd=0,
-    highlightbackground=COLORS["border"],
-    highlightthickness=1,
-    padx=14,
-    pady=10,
-)
-output_card.pack(fill="x")
-tk.Label(output_card, text="Dossier de sortie", font=LABEL_FONT, bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
-row_output = tk.Frame(output_card, bg=COLORS["card"])
-row_output.pack(fill="x", pady=(6, 0))
-tk.Button(
-    row_output,
-    text="Choisir...",
-    command=choisir_dossier,
-    bg=COLORS["warning"],
-    fg="white",
-    activebackground=COLORS["warning"],
-    activeforeground="white",
-    bd=0,
-    padx=12,
-    pady=8,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(side="left")
-label_dossier_value = tk.Label(
-    row_output,
-    text="Aucun dossier selectionne",
-    font=SUBTITLE_FONT,
-    bg=COLORS["card"],
-    fg=COLORS["muted"],
-    wraplength=400,
-    justify="left",
-)
-label_dossier_value.pack(side="left", padx=12)
-
-scroll_area = tk.Frame(container, bg=COLORS["bg"])
-scroll_area.pack(fill="both", expand=True, pady=(18, 10))
-
-content_canvas = tk.Canvas(scroll_area, bg=COLORS["bg"], highlightthickness=0)
-content_scrollbar = tk.Scrollbar(scroll_area, orient="vertical", command=content_canvas.yview)
-content_canvas.configure(yscrollcommand=content_scrollbar.set)
-content_scrollbar.pack(side="right", fill="y")
-content_canvas.pack(side="left", fill="both", expand=True)
-
-content_holder = tk.Frame(content_canvas, bg=COLORS["bg"])
-content_window = content_canvas.create_window((0, 0), window=content_holder, anchor="nw")
 
 
 def _on_holder_config(event):
@@ -601,165 +747,204 @@ def _on_mousewheel(event):
     content_canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
 
 
-content_holder.bind("<Configure>", _on_holder_config)
-content_canvas.bind("<Configure>", _on_canvas_config)
-content_canvas.bind_all("<MouseWheel>", _on_mousewheel)
+def _construire_habillage() -> None:
+    global content_canvas, content_holder, content_window, header_subtitle, label_dossier_value, logo_image
+    container = tk.Frame(root, bg=COLORS["bg"])
+    container.pack(fill="both", expand=True, padx=20, pady=20)
 
-status_bar = tk.Frame(container, bg=COLORS["bg"])
-status_bar.pack(fill="x", pady=(6, 0))
-tk.Label(status_bar, textvariable=status_message, font=SUBTITLE_FONT, bg=COLORS["bg"], fg=COLORS["muted"]).pack(anchor="w")
+    header = tk.Frame(container, bg=COLORS["bg"])
+    header.pack(fill="x")
+    logo_image = load_logo()
+    header_row = tk.Frame(header, bg=COLORS["bg"])
+    header_row.pack(fill="x")
+    if logo_image:
+        tk.Label(header_row, image=logo_image, bg=COLORS["bg"]).pack(side="left", padx=(0, 12))
+    else:
+        tk.Label(header_row, text="INGRID", font=("Segoe UI", 12, "bold"), bg=COLORS["bg"], fg=COLORS["text"]).pack(
+            side="left", padx=(0, 12)
+        )
+    titles = tk.Frame(header_row, bg=COLORS["bg"])
+    titles.pack(side="left", fill="x", expand=True)
+    tk.Label(titles, text="Facture Interne Projet - Generator V1", font=TITLE_FONT, bg=COLORS["bg"], fg=COLORS["text"]).pack(anchor="w")
+    header_subtitle = tk.Label(
+        titles,
+        text="Assistant de generation de factures base sur votre template Word.",
+        font=SUBTITLE_FONT,
+        bg=COLORS["bg"],
+        fg=COLORS["muted"],
+    )
+    header_subtitle.pack(anchor="w", pady=(2, 12))
+
+    output_card = tk.Frame(
+        container,
+        bg=COLORS["card"],
+        bd=0,
+        highlightbackground=COLORS["border"],
+        highlightthickness=1,
+        padx=14,
+        pady=10,
+    )
+    output_card.pack(fill="x")
+    tk.Label(output_card, text="Dossier de sortie", font=LABEL_FONT, bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
+    row_output = tk.Frame(output_card, bg=COLORS["card"])
+    row_output.pack(fill="x", pady=(6, 0))
+    tk.Button(
+        row_output,
+        text="Choisir...",
+        command=choisir_dossier,
+        bg=COLORS["warning"],
+        fg="white",
+        activebackground=COLORS["warning"],
+        activeforeground="white",
+        bd=0,
+        padx=12,
+        pady=8,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(side="left")
+    label_dossier_value = tk.Label(
+        row_output,
+        text="Aucun dossier selectionne",
+        font=SUBTITLE_FONT,
+        bg=COLORS["card"],
+        fg=COLORS["muted"],
+        wraplength=400,
+        justify="left",
+    )
+    label_dossier_value.pack(side="left", padx=12)
+
+    scroll_area = tk.Frame(container, bg=COLORS["bg"])
+    scroll_area.pack(fill="both", expand=True, pady=(18, 10))
+
+    content_canvas = tk.Canvas(scroll_area, bg=COLORS["bg"], highlightthickness=0)
+    content_scrollbar = tk.Scrollbar(scroll_area, orient="vertical", command=content_canvas.yview)
+    content_canvas.configure(yscrollcommand=content_scrollbar.set)
+    content_scrollbar.pack(side="right", fill="y")
+    content_canvas.pack(side="left", fill="both", expand=True)
+
+    content_holder = tk.Frame(content_canvas, bg=COLORS["bg"])
+    content_window = content_canvas.create_window((0, 0), window=content_holder, anchor="nw")
+
+
+    content_holder.bind("<Configure>", _on_holder_config)
+    content_canvas.bind("<Configure>", _on_canvas_config)
+    content_canvas.bind_all("<MouseWheel>", _on_mousewheel)
+
+    status_bar = tk.Frame(container, bg=COLORS["bg"])
+    status_bar.pack(fill="x", pady=(6, 0))
+    tk.Label(status_bar, textvariable=status_message, font=SUBTITLE_FONT, bg=COLORS["bg"], fg=COLORS["muted"]).pack(anchor="w")
 
 
 # Ecran accueil
-home_frame = tk.Frame(content_holder, bg=COLORS["bg"])
-home_card = tk.Frame(
-    home_frame,
-    bg=COLORS["card"],
-    highlightbackground=COLORS["border"],
-    highlightthickness=1,
-    padx=18,
-    pady=18,
-)
-home_card.pack(fill="both", expand=True)
-tk.Label(
-    home_card,
-    text="Bienvenue dans le generateur de factures - projet interne V1",
-    font=("Segoe UI", 14, "bold"),
-    bg=COLORS["card"],
-    fg=COLORS["text"],
-).pack(anchor="w")
-home_subtitle = tk.Label(
-    home_card,
-    text="Choisissez le mode qui correspond a votre flux : saisie rapide ou import Excel.",
-    font=SUBTITLE_FONT,
-    bg=COLORS["card"],
-    fg=COLORS["muted"],
-    wraplength=520,
-    justify="left",
-)
-home_subtitle.pack(anchor="w", pady=(6, 16))
-
-tiles = tk.Frame(home_card, bg=COLORS["card"])
-tiles.pack(fill="both", expand=True)
-tiles.grid_columnconfigure(0, weight=1, uniform="tile")
-tiles.grid_columnconfigure(1, weight=1, uniform="tile")
-
-tile_formulaire = tk.Frame(
-    tiles,
-    bg=COLORS["card"],
-    highlightbackground=COLORS["border"],
-    highlightthickness=1,
-    padx=14,
-    pady=14,
-)
-tile_formulaire.grid(row=0, column=0, padx=(0, 10), sticky="nsew")
-tk.Label(tile_formulaire, text="Remplir le formulaire", font=LABEL_FONT, bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
-form_desc_label = tk.Label(
-    tile_formulaire,
-    text="Pour une facture unique, saisissez les informations client et generez en un clic.",
-    font=SUBTITLE_FONT,
-    bg=COLORS["card"],
-    fg=COLORS["muted"],
-    wraplength=230,
-    justify="left",
-)
-form_desc_label.pack(anchor="w", pady=(4, 10))
-tk.Button(
-    tile_formulaire,
-    text="Aller au formulaire",
-    command=lambda: show_frame(form_frame),
-    bg=COLORS["accent"],
-    fg="white",
-    activebackground=COLORS["accent"],
-    activeforeground="white",
-    bd=0,
-    padx=12,
-    pady=10,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(anchor="e")
-
-tile_excel = tk.Frame(
-    tiles,
-    bg=COLORS["card"],
-    highlightbackground=COLORS["border"],
-    highlightthickness=1,
-    padx=14,
-    pady=14,
-)
-tile_excel.grid(row=0, column=1, padx=(10, 0), sticky="nsew")
-tk.Label(tile_excel, text="Charger un fichier Excel", font=LABEL_FONT, bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
-excel_desc_label = tk.Label(
-    tile_excel,
-    text="Importez un fichier Excel et generez automatiquement toutes les factures listees.",
-    font=SUBTITLE_FONT,
-    bg=COLORS["card"],
-    fg=COLORS["muted"],
-    wraplength=230,
-    justify="left",
-)
-excel_desc_label.pack(anchor="w", pady=(4, 10))
-tk.Button(
-    tile_excel,
-    text="Lancer l'import Excel",
-    command=lambda: show_frame(excel_frame),
-    bg=COLORS["success"],
-    fg="white",
-    activebackground=COLORS["success"],
-    activeforeground="white",
-    bd=0,
-    padx=12,
-    pady=10,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(anchor="e")
+
+
+def _construire_accueil() -> None:
+    global excel_desc_label, form_desc_label, home_frame, home_subtitle
+    home_frame = tk.Frame(content_holder, bg=COLORS["bg"])
+    home_card = tk.Frame(
+        home_frame,
+        bg=COLORS["card"],
+        highlightbackground=COLORS["border"],
+        highlightthickness=1,
+        padx=18,
+        pady=18,
+    )
+    home_card.pack(fill="both", expand=True)
+    tk.Label(
+        home_card,
+        text="Bienvenue dans le generateur de factures - projet interne V1",
+        font=("Segoe UI", 14, "bold"),
+        bg=COLORS["card"],
+        fg=COLORS["text"],
+    ).pack(anchor="w")
+    home_subtitle = tk.Label(
+        home_card,
+        text="Choisissez le mode qui correspond a votre flux : saisie rapide ou import Excel.",
+        font=SUBTITLE_FONT,
+        bg=COLORS["card"],
+        fg=COLORS["muted"],
+        wraplength=520,
+        justify="left",
+    )
+    home_subtitle.pack(anchor="w", pady=(6, 16))
+
+    tiles = tk.Frame(home_card, bg=COLORS["card"])
+    tiles.pack(fill="both", expand=True)
+    tiles.grid_columnconfigure(0, weight=1, uniform="tile")
+    tiles.grid_columnconfigure(1, weight=1, uniform="tile")
+
+    tile_formulaire = tk.Frame(
+        tiles,
+        bg=COLORS["card"],
+        highlightbackground=COLORS["border"],
+        highlightthickness=1,
+        padx=14,
+        pady=14,
+    )
+    tile_formulaire.grid(row=0, column=0, padx=(0, 10), sticky="nsew")
+    tk.Label(tile_formulaire, text="Remplir le formulaire", font=LABEL_FONT, bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
+    form_desc_label = tk.Label(
+        tile_formulaire,
+        text="Pour une facture unique, saisissez les informations client et generez en un clic.",
+        font=SUBTITLE_FONT,
+        bg=COLORS["card"],
+        fg=COLORS["muted"],
+        wraplength=230,
+        justify="left",
+    )
+    form_desc_label.pack(anchor="w", pady=(4, 10))
+    tk.Button(
+        tile_formulaire,
+        text="Aller au formulaire",
+        command=lambda: show_frame(form_frame),
+        bg=COLORS["accent"],
+        fg="white",
+        activebackground=COLORS["accent"],
+        activeforeground="white",
+        bd=0,
+        padx=12,
+        pady=10,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(anchor="e")
+
+    tile_excel = tk.Frame(
+        tiles,
+        bg=COLORS["card"],
+        highlightbackground=COLORS["border"],
+        highlightthickness=1,
+        padx=14,
+        pady=14,
+    )
+    tile_excel.grid(row=0, column=1, padx=(10, 0), sticky="nsew")
+    tk.Label(tile_excel, text="Charger un fichier Excel", font=LABEL_FONT, bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
+    excel_desc_label = tk.Label(
+        tile_excel,
+        text="Importez un fichier Excel et generez automatiquement toutes les factures listees.",
+        font=SUBTITLE_FONT,
+        bg=COLORS["card"],
+        fg=COLORS["muted"],
+        wraplength=230,
+        justify="left",
+    )
+    excel_desc_label.pack(anchor="w", pady=(4, 10))
+    tk.Button(
+        tile_excel,
+        text="Lancer l'import Excel",
+        command=lambda: show_frame(excel_frame),
+        bg=COLORS["success"],
+        fg="white",
+        activebackground=COLORS["success"],
+        activeforeground="white",
+        bd=0,
+        padx=12,
+        pady=10,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(anchor="e")
+
 
 # Historique
-history_card = tk.Frame(
-    home_frame,
-    bg=COLORS["card"],
-    highlightbackground=COLORS["border"],
-    highlightthickness=1,
-    padx=18,
-    pady=14,
-)
-history_card.pack(fill="both", expand=True, pady=(16, 0))
-tk.Label(history_card, text="Historique des factures generees", font=("Segoe UI", 13, "bold"), bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
-tk.Label(
-    history_card,
-    text="Liste des fichiers generes avec date et reference. Selectionnez une ligne pour la supprimer de l'historique.",
-    font=SUBTITLE_FONT,
-    bg=COLORS["card"],
-    fg=COLORS["muted"],
-    wraplength=520,
-    justify="left",
-).pack(anchor="w", pady=(4, 10))
-
-filters_row = tk.Frame(history_card, bg=COLORS["card"])
-filters_row.pack(fill="x", pady=(0, 10))
-tk.Label(filters_row, text="Filtrer par", font=SUBTITLE_FONT, bg=COLORS["card"], fg=COLORS["text"]).grid(
-    row=0, column=0, sticky="w", padx=(0, 6)
-)
-history_filter_mode = tk.StringVar(value="date_exacte")
-mode_options = [
-    ("Date exacte", "date_exacte"),
-    ("Intervalle de dates", "date_intervalle"),
-    ("Montant exact", "montant_exact"),
-    ("Intervalle de montant", "montant_intervalle"),
-    ("Titre / reference", "titre"),
-]
-tk.OptionMenu(filters_row, history_filter_mode, *[opt[1] for opt in mode_options]).grid(row=0, column=1, padx=(0, 10), sticky="w")
-
-dynamic_filter_area = tk.Frame(filters_row, bg=COLORS["card"])
-dynamic_filter_area.grid(row=1, column=0, columnspan=8, sticky="w")
-
-history_filter_date = None
-history_filter_start = None
-history_filter_end = None
-history_filter_amount = None
-history_filter_amount_min = None
-history_filter_amount_max = None
-history_filter_title = None
 
 
 def render_filter_fields(*args):
@@ -855,6 +1040,21 @@ def render_filter_fields(*args):
         history_filter_title = tk.Entry(dynamic_filter_area, font=ENTRY_FONT, width=26, bd=1, relief="solid", highlightthickness=0)
         history_filter_title.grid(row=row_base, column=1, padx=(0, 6))
 
+    for ent in [
+        history_filter_date,
+        history_filter_start,
+        history_filter_end,
+        history_filter_amount,
+        history_filter_amount_min,
+        history_filter_amount_max,
+        history_filter_title,
+    ]:
+        if ent:
+            ent.bind("<KeyRelease>", schedule_history_refresh)
+    if args:
+        # Changement de mode : l'ancien filtre ne s'applique plus
+        schedule_history_refresh()
+
     tk.Button(
         dynamic_filter_area,
         text="Filtrer",
@@ -885,72 +1085,106 @@ def render_filter_fields(*args):
     ).grid(row=row_base + 1, column=1, pady=(8, 0), sticky="w")
 
 
-history_filter_mode.trace_add("write", render_filter_fields)
-render_filter_fields()
-
-history_listbox = tk.Listbox(history_card, height=8, font=ENTRY_FONT, activestyle="dotbox")
-history_scroll = tk.Scrollbar(history_card, orient="vertical", command=history_listbox.yview)
-history_listbox.configure(yscrollcommand=history_scroll.set)
-history_listbox.pack(side="left", fill="both", expand=True)
-history_scroll.pack(side="right", fill="y")
-
-tk.Button(
-    history_card,
-    text="Supprimer la selection",
-    command=remove_history_selected,
-    bg="#fee2e2",
-    fg="#991b1b",
-    activebackground="#fee2e2",
-    activeforeground="#991b1b",
-    bd=0,
-    padx=12,
-    pady=8,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(anchor="e", pady=(10, 0))
-tk.Button(
-    history_card,
-    text="Exporter l'historique (Excel)",
-    command=export_history_excel,
-    bg="#e2e8f0",
-    fg=COLORS["text"],
-    activebackground="#e2e8f0",
-    activeforeground=COLORS["text"],
-    bd=0,
-    padx=12,
-    pady=8,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(anchor="e", pady=(6, 6))
+def _construire_historique() -> None:
+    global dynamic_filter_area, history_filter_amount, history_filter_amount_max, history_filter_amount_min
+    global history_filter_date, history_filter_end, history_filter_mode, history_filter_start, history_filter_title
+    global history_sort, history_view
+    history_card = tk.Frame(
+        home_frame,
+        bg=COLORS["card"],
+        highlightbackground=COLORS["border"],
+        highlightthickness=1,
+        padx=18,
+        pady=14,
+    )
+    history_card.pack(fill="both", expand=True, pady=(16, 0))
+    tk.Label(history_card, text="Historique des factures generees", font=("Segoe UI", 13, "bold"), bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
+    tk.Label(
+        history_card,
+        text="Liste des fichiers generes avec date et reference. Selectionnez une ligne pour la supprimer de l'historique.",
+        font=SUBTITLE_FONT,
+        bg=COLORS["card"],
+        fg=COLORS["muted"],
+        wraplength=520,
+        justify="left",
+    ).pack(anchor="w", pady=(4, 10))
+
+    filters_row = tk.Frame(history_card, bg=COLORS["card"])
+    filters_row.pack(fill="x", pady=(0, 10))
+    tk.Label(filters_row, text="Filtrer par", font=SUBTITLE_FONT, bg=COLORS["card"], fg=COLORS["text"]).grid(
+        row=0, column=0, sticky="w", padx=(0, 6)
+    )
+    history_filter_mode = tk.StringVar(value="date_exacte")
+    mode_options = [
+        ("Date exacte", "date_exacte"),
+        ("Intervalle de dates", "date_intervalle"),
+        ("Montant exact", "montant_exact"),
+        ("Intervalle de montant", "montant_intervalle"),
+        ("Titre / reference", "titre"),
+    ]
+    tk.OptionMenu(filters_row, history_filter_mode, *[opt[1] for opt in mode_options]).grid(row=0, column=1, padx=(0, 10), sticky="w")
+    tk.Label(filters_row, text="Trier par", font=SUBTITLE_FONT, bg=COLORS["card"], fg=COLORS["text"]).grid(
+        row=0, column=2, sticky="w", padx=(0, 6)
+    )
+    history_sort = tk.StringVar(value="id")
+    sort_options = [
+        ("Ordre d'ajout", "id"),
+        ("Date croissante", "date_asc"),
+        ("Date decroissante", "date_desc"),
+        ("Montant croissant", "montant_asc"),
+        ("Montant decroissant", "montant_desc"),
+    ]
+    tk.OptionMenu(filters_row, history_sort, *[opt[1] for opt in sort_options]).grid(row=0, column=3, padx=(0, 10), sticky="w")
+
+    dynamic_filter_area = tk.Frame(filters_row, bg=COLORS["card"])
+    dynamic_filter_area.grid(row=1, column=0, columnspan=8, sticky="w")
+
+    history_filter_date = None
+    history_filter_start = None
+    history_filter_end = None
+    history_filter_amount = None
+    history_filter_amount_min = None
+    history_filter_amount_max = None
+    history_filter_title = None
+
+
+    history_filter_mode.trace_add("write", render_filter_fields)
+    render_filter_fields()
+
+    history_view = VirtualHistoryList(history_card, format_row=format_history_row, font=ENTRY_FONT, bg=COLORS["card"])
+    history_view.pack(side="left", fill="both", expand=True)
+
+    tk.Button(
+        history_card,
+        text="Supprimer la selection",
+        command=remove_history_selected,
+        bg="#fee2e2",
+        fg="#991b1b",
+        activebackground="#fee2e2",
+        activeforeground="#991b1b",
+        bd=0,
+        padx=12,
+        pady=8,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(anchor="e", pady=(10, 0))
+    tk.Button(
+        history_card,
+        text="Exporter l'historique (Excel)",
+        command=export_history_excel,
+        bg="#e2e8f0",
+        fg=COLORS["text"],
+        activebackground="#e2e8f0",
+        activeforeground=COLORS["text"],
+        bd=0,
+        padx=12,
+        pady=8,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(anchor="e", pady=(6, 6))
 
 
 # Ecran formulaire manuel
-form_frame = tk.Frame(content_holder, bg=COLORS["bg"])
-form_card = tk.Frame(
-    form_frame,
-    bg=COLORS["card"],
-    highlightbackground=COLORS["border"],
-    highlightthickness=1,
-    padx=18,
-    pady=18,
-)
-form_card.pack(fill="both", expand=True)
-tk.Label(form_card, text="Formulaire client", font=("Segoe UI", 14, "bold"), bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
-form_info_label = tk.Label(
-    form_card,
-    text="Completez les champs alignes avec le modele : code projet, code sous-projet, numero OTFI, poles, departements, dates, periode et somme facture. Ajoutez vos lignes de prestations ci-dessous, le montant et le total sont calcules automatiquement.",
-    font=SUBTITLE_FONT,
-    bg=COLORS["card"],
-    fg=COLORS["muted"],
-    wraplength=520,
-    justify="left",
-)
-form_info_label.pack(anchor="w", pady=(4, 14))
-
-fields_frame = tk.Frame(form_card, bg=COLORS["card"])
-fields_frame.pack(fill="x")
-fields_frame.grid_columnconfigure(0, weight=0)
-fields_frame.grid_columnconfigure(1, weight=1)
 
 
 def add_entry(row: int, label: str) -> tk.Entry:
@@ -994,38 +1228,6 @@ def add_date_entry(row: int, label: str, target: str):
     return entry
 
 
-entry_code_projet = add_entry(0, "Code projet")
-entry_code_sous_projet = add_entry(1, "Code sous-projet")
-entry_numero_otfi = add_entry(2, "Numero OTFI")
-entry_pole_emettrice = add_entry(3, "Pole emettrice")
-entry_pole_destinataire = add_entry(4, "Pole destinataire")
-entry_dept_dir_emettrice = add_entry(5, "Departement / Direction emettrice")
-entry_dept_dir_destinataire = add_entry(6, "Departement / Direction destinataire")
-add_date_entry(7, "Date emission (JJ/MM/AAAA)", target="emission")
-add_date_entry(8, "Date du jour (JJ/MM/AAAA)", target="jour")
-entry_periode_concernee = add_entry(9, "Periode concernee")
-entry_somme_facture = add_entry(10, "Somme facture")
-
-tk.Label(form_card, text="Lignes de prestations", font=LABEL_FONT, bg=COLORS["card"], fg=COLORS["text"]).pack(
-    anchor="w", pady=(16, 8)
-)
-lines_table = tk.Frame(form_card, bg=COLORS["card"])
-lines_table.pack(fill="both", expand=True)
-headers = [
-    ("Ligne", 0, 0),
-    ("Designation", 1, 3),
-    ("Type prestation", 2, 2),
-    ("Unite", 3, 1),
-    ("Quantite", 4, 1),
-    ("Prix unitaire", 5, 2),
-    ("Actions", 6, 0),
-]
-for text, col, weight in headers:
-    lbl = tk.Label(lines_table, text=text, font=LABEL_FONT, bg=COLORS["card"], fg=COLORS["muted"])
-    lbl.grid(row=0, column=col, padx=4, pady=(0, 2), sticky="w")
-    lines_table.grid_columnconfigure(col, weight=weight)
-
-
 def refresh_ligne_labels():
     for idx, row in enumerate(ligne_entries, start=1):
         row["label"].config(text=f"Ligne {idx}")
@@ -1134,139 +1336,137 @@ def reset_form():
     set_status("Formulaire reinitialise. Choisissez un dossier et remplissez les informations.")
 
 
-# init avec 3 lignes vides
-for _ in range(3):
-    add_ligne_row()
-
-tk.Button(
-    form_card,
-    text="Ajouter une ligne",
-    command=add_ligne_row,
-    bg="#e2e8f0",
-    fg=COLORS["text"],
-    activebackground="#e2e8f0",
-    activeforeground=COLORS["text"],
-    bd=0,
-    padx=12,
-    pady=8,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(anchor="w", pady=(10, 0))
-
-actions_form = tk.Frame(form_card, bg=COLORS["card"])
-actions_form.pack(fill="x", pady=(18, 0))
-tk.Button(
-    actions_form,
-    text="Reinitialiser",
-    command=reset_form,
-    bg="#e2e8f0",
-    fg=COLORS["text"],
-    activebackground="#e2e8f0",
-    activeforeground=COLORS["text"],
-    bd=0,
-    padx=12,
-    pady=10,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(side="left", padx=(0, 8))
-
-tk.Button(
-    actions_form,
-    text="Retour a l'accueil",
-    command=lambda: show_frame(home_frame),
-    bg="#cbd5e1",
-    fg=COLORS["text"],
-    activebackground="#cbd5e1",
-    activeforeground=COLORS["text"],
-    bd=0,
-    padx=12,
-    pady=10,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(side="left")
-tk.Button(
-    actions_form,
-    text="Generer la facture",
-    command=generer_manuel,
-    bg=COLORS["accent"],
-    fg="white",
-    activebackground=COLORS["accent"],
-    activeforeground="white",
-    bd=0,
-    padx=14,
-    pady=10,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(side="right")
+def _construire_formulaire() -> None:
+    global entry_code_projet, entry_code_sous_projet, entry_dept_dir_destinataire, entry_dept_dir_emettrice
+    global entry_numero_otfi, entry_periode_concernee, entry_pole_destinataire, entry_pole_emettrice
+    global entry_somme_facture, fields_frame, form_frame, form_info_label, lines_table
+    form_frame = tk.Frame(content_holder, bg=COLORS["bg"])
+    form_card = tk.Frame(
+        form_frame,
+        bg=COLORS["card"],
+        highlightbackground=COLORS["border"],
+        highlightthickness=1,
+        padx=18,
+        pady=18,
+    )
+    form_card.pack(fill="both", expand=True)
+    tk.Label(form_card, text="Formulaire client", font=("Segoe UI", 14, "bold"), bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
+    form_info_label = tk.Label(
+        form_card,
+        text="Completez les champs alignes avec le modele : code projet, code sous-projet, numero OTFI, poles, departements, dates, periode et somme facture. Ajoutez vos lignes de prestations ci-dessous, le montant et le total sont calcules automatiquement.",
+        font=SUBTITLE_FONT,
+        bg=COLORS["card"],
+        fg=COLORS["muted"],
+        wraplength=520,
+        justify="left",
+    )
+    form_info_label.pack(anchor="w", pady=(4, 14))
+
+    fields_frame = tk.Frame(form_card, bg=COLORS["card"])
+    fields_frame.pack(fill="x")
+    fields_frame.grid_columnconfigure(0, weight=0)
+    fields_frame.grid_columnconfigure(1, weight=1)
+
+
+    entry_code_projet = add_entry(0, "Code projet")
+    entry_code_sous_projet = add_entry(1, "Code sous-projet")
+    entry_numero_otfi = add_entry(2, "Numero OTFI")
+    entry_pole_emettrice = add_entry(3, "Pole emettrice")
+    entry_pole_destinataire = add_entry(4, "Pole destinataire")
+    entry_dept_dir_emettrice = add_entry(5, "Departement / Direction emettrice")
+    entry_dept_dir_destinataire = add_entry(6, "Departement / Direction destinataire")
+    add_date_entry(7, "Date emission (JJ/MM/AAAA)", target="emission")
+    add_date_entry(8, "Date du jour (JJ/MM/AAAA)", target="jour")
+    entry_periode_concernee = add_entry(9, "Periode concernee")
+    entry_somme_facture = add_entry(10, "Somme facture")
+
+    tk.Label(form_card, text="Lignes de prestations", font=LABEL_FONT, bg=COLORS["card"], fg=COLORS["text"]).pack(
+        anchor="w", pady=(16, 8)
+    )
+    lines_table = tk.Frame(form_card, bg=COLORS["card"])
+    lines_table.pack(fill="both", expand=True)
+    headers = [
+        ("Ligne", 0, 0),
+        ("Designation", 1, 3),
+        ("Type prestation", 2, 2),
+        ("Unite", 3, 1),
+        ("Quantite", 4, 1),
+        ("Prix unitaire", 5, 2),
+        ("Actions", 6, 0),
+    ]
+    for text, col, weight in headers:
+        lbl = tk.Label(lines_table, text=text, font=LABEL_FONT, bg=COLORS["card"], fg=COLORS["muted"])
+        lbl.grid(row=0, column=col, padx=4, pady=(0, 2), sticky="w")
+        lines_table.grid_columnconfigure(col, weight=weight)
+
+
+    # init avec 3 lignes vides
+    for _ in range(3):
+        add_ligne_row()
+
+    tk.Button(
+        form_card,
+        text="Ajouter une ligne",
+        command=add_ligne_row,
+        bg="#e2e8f0",
+        fg=COLORS["text"],
+        activebackground="#e2e8f0",
+        activeforeground=COLORS["text"],
+        bd=0,
+        padx=12,
+        pady=8,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(anchor="w", pady=(10, 0))
+
+    actions_form = tk.Frame(form_card, bg=COLORS["card"])
+    actions_form.pack(fill="x", pady=(18, 0))
+    tk.Button(
+        actions_form,
+        text="Reinitialiser",
+        command=reset_form,
+        bg="#e2e8f0",
+        fg=COLORS["text"],
+        activebackground="#e2e8f0",
+        activeforeground=COLORS["text"],
+        bd=0,
+        padx=12,
+        pady=10,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(side="left", padx=(0, 8))
+
+    tk.Button(
+        actions_form,
+        text="Retour a l'accueil",
+        command=lambda: show_frame(home_frame),
+        bg="#cbd5e1",
+        fg=COLORS["text"],
+        activebackground="#cbd5e1",
+        activeforeground=COLORS["text"],
+        bd=0,
+        padx=12,
+        pady=10,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(side="left")
+    tk.Button(
+        actions_form,
+        text="Generer la facture",
+        command=generer_manuel,
+        bg=COLORS["accent"],
+        fg="white",
+        activebackground=COLORS["accent"],
+        activeforeground="white",
+        bd=0,
+        padx=14,
+        pady=10,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(side="right")
 
 
 # Ecran import Excel
-excel_frame = tk.Frame(content_holder, bg=COLORS["bg"])
-excel_card = tk.Frame(
-    excel_frame,
-    bg=COLORS["card"],
-    highlightbackground=COLORS["border"],
-    highlightthickness=1,
-    padx=18,
-    pady=18,
-)
-excel_card.pack(fill="both", expand=True)
-tk.Label(excel_card, text="Generation depuis Excel", font=("Segoe UI", 14, "bold"), bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
-excel_info_label = tk.Label(
-    excel_card,
-    text="Importez un fichier Excel (.xlsx) avec les colonnes : code_projet, code_sous_projet, numero_otfi, pole_emettrice, pole_destinataire, dept_dir_emettrice, dept_dir_destinataire, date_emission, date_du_jour, periode_concernee, somme_facture.",
-    font=SUBTITLE_FONT,
-    bg=COLORS["card"],
-    fg=COLORS["muted"],
-    wraplength=520,
-    justify="left",
-)
-excel_info_label.pack(anchor="w", pady=(4, 14))
-
-excel_actions = tk.Frame(excel_card, bg=COLORS["card"])
-excel_actions.pack(fill="x", pady=(10, 0))
-tk.Button(
-    excel_actions,
-    text="Template de remplissage",
-    command=export_excel_template,
-    bg="#e2e8f0",
-    fg=COLORS["text"],
-    activebackground="#e2e8f0",
-    activeforeground=COLORS["text"],
-    bd=0,
-    padx=12,
-    pady=10,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(side="left", padx=(0, 10))
-tk.Button(
-    excel_actions,
-    text="Retour a l'accueil",
-    command=lambda: show_frame(home_frame),
-    bg="#cbd5e1",
-    fg=COLORS["text"],
-    activebackground="#cbd5e1",
-    activeforeground=COLORS["text"],
-    bd=0,
-    padx=12,
-    pady=10,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(side="left")
-tk.Button(
-    excel_actions,
-    text="Charger un fichier Excel et generer",
-    command=generer_depuis_excel,
-    bg=COLORS["success"],
-    fg="white",
-    activebackground=COLORS["success"],
-    activeforeground="white",
-    bd=0,
-    padx=14,
-    pady=10,
-    font=BUTTON_FONT,
-    cursor="hand2",
-).pack(side="right")
 
 
 def update_wraplength() -> None:
@@ -1286,9 +1486,150 @@ def update_wraplength() -> None:
     excel_desc_label.config(wraplength=tile_width)
 
 
-show_frame(home_frame)
-update_wraplength()
-history_data = load_history()
-refresh_history_ui()
-root.bind("<Configure>", lambda event: update_wraplength())
-root.mainloop()
+def _construire_excel() -> None:
+    global excel_cancel_button, excel_frame, excel_generate_button, excel_info_label, excel_progress
+    excel_frame = tk.Frame(content_holder, bg=COLORS["bg"])
+    excel_card = tk.Frame(
+        excel_frame,
+        bg=COLORS["card"],
+        highlightbackground=COLORS["border"],
+        highlightthickness=1,
+        padx=18,
+        pady=18,
+    )
+    excel_card.pack(fill="both", expand=True)
+    tk.Label(excel_card, text="Generation depuis Excel", font=("Segoe UI", 14, "bold"), bg=COLORS["card"], fg=COLORS["text"]).pack(anchor="w")
+    excel_info_label = tk.Label(
+        excel_card,
+        text="Importez un fichier Excel (.xlsx) ou CSV/TSV avec les colonnes : code_projet, code_sous_projet, numero_otfi, pole_emettrice, pole_destinataire, dept_dir_emettrice, dept_dir_destinataire, date_emission, date_du_jour, periode_concernee, somme_facture.",
+        font=SUBTITLE_FONT,
+        bg=COLORS["card"],
+        fg=COLORS["muted"],
+        wraplength=520,
+        justify="left",
+    )
+    excel_info_label.pack(anchor="w", pady=(4, 14))
+
+    excel_actions = tk.Frame(excel_card, bg=COLORS["card"])
+    excel_actions.pack(fill="x", pady=(10, 0))
+    tk.Button(
+        excel_actions,
+        text="Template de remplissage",
+        command=export_excel_template,
+        bg="#e2e8f0",
+        fg=COLORS["text"],
+        activebackground="#e2e8f0",
+        activeforeground=COLORS["text"],
+        bd=0,
+        padx=12,
+        pady=10,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(side="left", padx=(0, 10))
+    tk.Button(
+        excel_actions,
+        text="Retour a l'accueil",
+        command=lambda: show_frame(home_frame),
+        bg="#cbd5e1",
+        fg=COLORS["text"],
+        activebackground="#cbd5e1",
+        activeforeground=COLORS["text"],
+        bd=0,
+        padx=12,
+        pady=10,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    ).pack(side="left")
+    excel_generate_button = tk.Button(
+        excel_actions,
+        text="Charger un fichier Excel et generer",
+        command=generer_depuis_excel,
+        bg=COLORS["success"],
+        fg="white",
+        activebackground=COLORS["success"],
+        activeforeground="white",
+        bd=0,
+        padx=14,
+        pady=10,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    )
+    excel_generate_button.pack(side="right")
+
+    tk.Checkbutton(
+        excel_card,
+        text="Tout regenerer (meme les factures inchangees depuis le dernier import)",
+        variable=excel_force,
+        bg=COLORS["card"],
+        fg=COLORS["text"],
+        activebackground=COLORS["card"],
+        font=ENTRY_FONT,
+        anchor="w",
+    ).pack(fill="x", pady=(10, 0))
+    tk.Checkbutton(
+        excel_card,
+        text="Lire toutes les feuilles de chaque classeur (une feuille par pole...)",
+        variable=excel_toutes_feuilles,
+        bg=COLORS["card"],
+        fg=COLORS["text"],
+        activebackground=COLORS["card"],
+        font=ENTRY_FONT,
+        anchor="w",
+    ).pack(fill="x")
+
+    excel_progress_row = tk.Frame(excel_card, bg=COLORS["card"])
+    excel_progress_row.pack(fill="x", pady=(14, 0))
+    excel_progress = ttk.Progressbar(excel_progress_row, orient="horizontal", mode="determinate")
+    excel_progress.pack(side="left", fill="x", expand=True, padx=(0, 10))
+    excel_cancel_button = tk.Button(
+        excel_progress_row,
+        text="Annuler",
+        command=annuler_generation,
+        state="disabled",
+        bg="#fee2e2",
+        fg="#991b1b",
+        activebackground="#fee2e2",
+        activeforeground="#991b1b",
+        bd=0,
+        padx=12,
+        pady=6,
+        font=BUTTON_FONT,
+        cursor="hand2",
+    )
+    excel_cancel_button.pack(side="right")
+
+
+def main() -> None:
+    global root, dossier_sortie, excel_force, excel_toutes_feuilles, status_message, history_store
+    root = tk.Tk()
+    root.title("Facture interne projet V1")
+    root.geometry("900x780")
+    root.minsize(760, 700)
+    root.configure(bg=COLORS["bg"])
+    root.resizable(True, True)
+
+    dossier_sortie = tk.StringVar(value="")
+    excel_force = tk.BooleanVar(value=False)
+    excel_toutes_feuilles = tk.BooleanVar(value=False)
+    status_message = tk.StringVar(value="Choisissez un dossier de sortie pour commencer.")
+
+    _construire_habillage()
+    _construire_accueil()
+    _construire_historique()
+    _construire_formulaire()
+    _construire_excel()
+
+    show_frame(home_frame)
+    update_wraplength()
+    history_store = load_history()
+    history_sort.trace_add("write", lambda *args: refresh_history_ui())
+    refresh_history_ui()
+    root.bind("<Configure>", lambda event: update_wraplength())
+    root.protocol("WM_DELETE_WINDOW", fermer_application)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    # Necessaire pour le pool de generation dans l'executable PyInstaller
+    multiprocessing.freeze_support()
+    main()
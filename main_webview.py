@@ -1,8 +1,13 @@
 import webview
+import multiprocessing
 import os
 from tkinter import filedialog, messagebox
+from batch_generator import iterer_lot, position_resultat
+from checkpoint import PointReprise, derniere_position
 from generate_facture import generer_facture
 from excel_loader import charger_donnees_excel
+from output_manifest import ManifesteSortie
+from rejects_report import RapportRejets, chemin_rejets
 
 
 class Api:
@@ -23,36 +28,76 @@ class Api:
         chemin = generer_facture(data, self.dossier_sortie)
         return f"✅ Facture générée : {chemin}"
 
-    def generer_depuis_excel(self):
+    def generer_depuis_excel(self, force=False):
+        """Generation depuis Excel ; `force` regenere aussi les factures inchangees depuis le dernier lancement."""
         if not self.dossier_sortie:
             return "Veuillez d'abord choisir un dossier de sortie."
 
         fichier_excel = filedialog.askopenfilename(
             title="Sélectionner le fichier Excel",
-            filetypes=[("Excel files", "*.xlsx")]
+            filetypes=[("Excel or CSV files", "*.xlsx *.csv *.tsv *.txt")]
         )
         if not fichier_excel:
             return "Aucun fichier sélectionné."
 
-        for data in charger_donnees_excel(fichier_excel):
-            generer_facture(data, self.dossier_sortie)
-        return "✅ Toutes les factures ont été générées avec succès !"
+        reprise = PointReprise(self.dossier_sortie, fichier_excel)
+        depart = 0
+        etat = reprise.charger()
+        if etat is not None and messagebox.askyesno(
+            "Reprendre la génération",
+            f"Une génération précédente de ce fichier s'est arrêtée après la {derniere_position(etat)}.\n"
+            "Reprendre à partir de la ligne suivante ?",
+        ):
+            depart = reprise.reprendre(etat)
 
+        manifeste = ManifesteSortie(self.dossier_sortie, force=force)
+        rapport = RapportRejets(chemin_rejets(self.dossier_sortie))
+        if depart:
+            rapport.reprendre()
+        erreurs = []
+        records = charger_donnees_excel(fichier_excel, streaming=True)
+        termine = False
+        try:
+            for resultat in iterer_lot(records, self.dossier_sortie, ignorer=manifeste.a_jour, depart=depart):
+                rapport.noter(resultat["data"])
+                if resultat["erreur"]:
+                    erreurs.append(f"{position_resultat(resultat)} : {resultat['erreur']}")
+                elif not resultat["ignore"]:
+                    manifeste.enregistrer(resultat["data"], resultat["chemin"])
+                reprise.avancer(resultat["index"], resultat["chemin"], erreur=bool(resultat["erreur"]), data=resultat["data"])
+            termine = True
+        finally:
+            manifeste.sauver()
+            chemin_rapport = rapport.fermer()
+            if termine:
+                reprise.terminer()
+            else:
+                reprise.sauver()
+        ignores = f"\n{manifeste.ignores} facture(s) inchangée(s) non régénérée(s)." if manifeste.ignores else ""
+        if chemin_rapport:
+            ignores += f"\nLignes rejetées avant rendu : voir {chemin_rapport}"
+        if erreurs:
+            return f"⚠️ {len(erreurs)} facture(s) en erreur :\n" + "\n".join(erreurs[:10]) + ignores
+        return "✅ Toutes les factures ont été générées avec succès !" + ignores
 
-# --- Charger ton fichier HTML local ---
-base_path = os.path.abspath(os.path.dirname(__file__))
-html_file_path = os.path.join(base_path, "web", "index.html")
 
-if not os.path.exists(html_file_path):
-    raise FileNotFoundError("Le fichier HTML de l'interface est introuvable : web/index.html")
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
 
-# --- Lancer la fenêtre WebView ---
-api = Api()
-webview.create_window(
-    title="Fact Gen 1 BNETD",
-    url=f"file://{html_file_path}",
-    js_api=api,
-    width=1280,
-    height=720
-)
-webview.start()
+    # --- Charger ton fichier HTML local ---
+    base_path = os.path.abspath(os.path.dirname(__file__))
+    html_file_path = os.path.join(base_path, "web", "index.html")
+
+    if not os.path.exists(html_file_path):
+        raise FileNotFoundError("Le fichier HTML de l'interface est introuvable : web/index.html")
+
+    # --- Lancer la fenêtre WebView ---
+    api = Api()
+    webview.create_window(
+        title="Fact Gen 1 BNETD",
+        url=f"file://{html_file_path}",
+        js_api=api,
+        width=1280,
+        height=720
+    )
+    webview.start()
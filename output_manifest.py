@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+
+from generate_facture import TEMPLATE_PATH, nom_facture, resource_path
+
+
+NOM_MANIFESTE = ".facture_manifest.json"
+
+
+def empreinte_fichier(chemin):
+    h = hashlib.sha256()
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+
+def empreinte_donnees(data):
+    """
+    Empreinte stable d'un enregistrement mappe (cles triees, dates en texte).
+    Les champs internes du chargement (`_ligne`...) n'en font pas partie : une
+    facture deplacee dans le fichier reste a jour.
+    """
+    donnees = {cle: valeur for cle, valeur in data.items() if not cle.startswith("_")}
+    texte = json.dumps(donnees, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.blake2b(texte.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ManifesteSortie:
+    """
+    Manifeste `.facture_manifest.json` du dossier de sortie : pour chaque facture,
+    empreinte des donnees mappees et du template qui l'ont produite. Une ligne
+    dont les deux empreintes sont inchangees et dont le fichier existe encore
+    n'est pas regeneree (sauf `force`).
+    """
+
+    def __init__(self, dossier, template_path=None, force=False, sauver_tous=200):
+        self.dossier = dossier
+        self.chemin = os.path.join(dossier, NOM_MANIFESTE)
+        self.template = empreinte_fichier(template_path or resource_path(TEMPLATE_PATH))
+        self.force = force
+        self.sauver_tous = sauver_tous
+        self.factures = self._charger()
+        self.ignores = 0
+        self.en_attente = 0
+
+    def _charger(self):
+        try:
+            with open(self.chemin, "r", encoding="utf-8") as f:
+                contenu = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        factures = contenu.get("factures") if isinstance(contenu, dict) else None
+        return factures if isinstance(factures, dict) else {}
+
+    def a_jour(self, data, nom=None):
+        """True si la facture de `data` (fichier `nom`) est deja generee a l'identique (comptee comme ignoree)."""
+        if self.force:
+            return False
+        nom = nom or nom_facture(data)
+        entree = self.factures.get(nom)
+        if (
+            entree is None
+            or entree.get("template") != self.template
+            or entree.get("donnees") != empreinte_donnees(data)
+            or not os.path.exists(os.path.join(self.dossier, nom))
+        ):
+            return False
+        self.ignores += 1
+        return True
+
+    def enregistrer(self, data, chemin):
+        self.factures[os.path.basename(chemin)] = {"donnees": empreinte_donnees(data), "template": self.template}
+        self.en_attente += 1
+        # Sauvegarde reguliere : un arret brutal ne perd que les dernieres factures
+        if self.sauver_tous and self.en_attente >= self.sauver_tous:
+            self.sauver()
+
+    def sauver(self):
+        os.makedirs(self.dossier, exist_ok=True)
+        temporaire = self.chemin + ".tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "factures": self.factures}, f, ensure_ascii=False)
+        os.replace(temporaire, self.chemin)
+        self.en_attente = 0
@@ -0,0 +1,116 @@
+import os
+import re
+
+
+# Caracteres interdits dans un nom de fichier Windows (et separateurs de chemin)
+_CARACTERES_INTERDITS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+def nettoyer_nom(nom):
+    """Nom de fichier utilisable sur tous les systemes (caracteres interdits -> _)."""
+    nom = _CARACTERES_INTERDITS.sub("_", str(nom)).strip().rstrip(".")
+    return nom or "_"
+
+
+def chemin_temporaire(dossier, nom, pid=None):
+    """Fichier temporaire (cache) d'ecriture de `nom` par le processus `pid`."""
+    return os.path.join(dossier, f".{nom}.{pid or os.getpid()}.tmp")
+
+
+class NomsUniques:
+    """
+    Attribution des noms d'un lot, dans l'ordre des lignes : la premiere
+    occurrence garde son nom, les suivantes recoivent _2, _3... Le resultat ne
+    depend que de l'ordre d'entree (pas de l'ordre de fin des processus), donc
+    une relance du meme fichier redonne les memes noms. Comparaison insensible
+    a la casse, comme sous Windows.
+    """
+
+    def __init__(self):
+        self.pris = set()
+
+    def reserver(self, nom):
+        nom = nettoyer_nom(nom)
+        base, ext = os.path.splitext(nom)
+        candidat = nom
+        numero = 1
+        while candidat.casefold() in self.pris:
+            numero += 1
+            candidat = f"{base}_{numero}{ext}"
+        self.pris.add(candidat.casefold())
+        return candidat
+
+
+class EcrivainSorties:
+    """
+    Ecriture atomique des factures dans `dossier` : contenu ecrit dans un
+    fichier temporaire propre au processus puis renomme (os.replace). Un arret
+    brutal ne laisse jamais de .docx a moitie ecrit sous son nom final.
+
+    `fsync_tous` : 0 = pas de fsync (defaut), 1 = fsync de chaque fichier,
+    N = fsync groupe tous les N fichiers (et a la fermeture), suivi d'un seul
+    fsync du dossier.
+    """
+
+    def __init__(self, dossier, fsync_tous=0):
+        self.dossier = dossier
+        self.fsync_tous = fsync_tous
+        self.en_attente = []
+        self.dossier_pret = False
+
+    def ecrire(self, nom, ecrire):
+        """Appelle `ecrire(fichier)` sur un temporaire puis le publie sous `nom` ; renvoie le chemin."""
+        if not self.dossier_pret:
+            os.makedirs(self.dossier, exist_ok=True)
+            self.dossier_pret = True
+        chemin = os.path.join(self.dossier, nom)
+        temporaire = chemin_temporaire(self.dossier, nom)
+        try:
+            with open(temporaire, "wb") as f:
+                ecrire(f)
+                if self.fsync_tous == 1:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temporaire, chemin)
+        except BaseException:
+            try:
+                os.remove(temporaire)
+            except OSError:
+                pass
+            raise
+        if self.fsync_tous > 1:
+            self.en_attente.append(chemin)
+            if len(self.en_attente) >= self.fsync_tous:
+                self.synchroniser()
+        elif self.fsync_tous == 1:
+            self._fsync_dossier()
+        return chemin
+
+    def synchroniser(self):
+        """Force l'ecriture sur disque des fichiers publies depuis le dernier appel."""
+        if not self.en_attente:
+            return
+        for chemin in self.en_attente:
+            try:
+                fd = os.open(chemin, os.O_RDWR | getattr(os, "O_BINARY", 0))
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.en_attente = []
+        self._fsync_dossier()
+
+    def _fsync_dossier(self):
+        # Rend les renommages durables (POSIX uniquement)
+        if not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self.dossier, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def fermer(self):
+        self.synchroniser()
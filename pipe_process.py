@@ -0,0 +1,36 @@
+import signal
+
+
+def _executer(cible, conn, args):
+    # Ctrl+C est gere par le processus principal, qui arrete ses processus fils
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cible(conn, *args)
+
+
+class ProcessusPipe:
+    """
+    Processus fils relie au processus principal par un Pipe : `cible(conn, *args)`
+    y tourne jusqu'a recevoir None (ou la fermeture du Pipe). Partage par le pool
+    de rendu (batch_generator) et les lecteurs de sources (source_loader).
+    """
+
+    def __init__(self, ctx, cible, *args):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_executer, args=(cible, child_conn, args), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, force=False):
+        """Arret demande (None envoye), ou immediat avec `force` ; tue le processus s'il ne s'arrete pas."""
+        if force:
+            self.process.terminate()
+        else:
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
@@ -0,0 +1,70 @@
+import csv
+import os
+
+from excel_loader import CHAMPS_REFERENCE
+
+
+NOM_REJETS = "rejets.csv"
+
+
+def chemin_rejets(dossier_sortie=None, archive=None):
+    """Rapport a cote des factures : <dossier>/rejets.csv, ou <archive>_rejets.csv pour un lot ZIP."""
+    if archive:
+        return f"{os.path.splitext(archive)[0]}_rejets.csv"
+    return os.path.join(dossier_sortie, NOM_REJETS)
+
+
+class RapportRejets:
+    """
+    Lignes refusees par le controle avant rendu (champ `rejet` des
+    enregistrements, et groupes de la feuille Lignes ecartes a la jointure,
+    champ `_lignes_ecartees`) : numero de ligne Excel, source, reference, motif.
+    Fichier `;` en UTF-8 avec BOM (ouvrable dans Excel), ecrit a la fermeture ;
+    un rapport d'un lancement precedent est supprime s'il n'y a plus de rejet,
+    sauf a la reprise d'un lot (voir reprendre).
+    """
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.rejets = []
+
+    def reprendre(self):
+        """
+        Reprise d'un lot interrompu : les lignes avant le point de reprise ne sont
+        pas relues, leurs rejets deja ecrits sont repris dans le rapport.
+        """
+        try:
+            with open(self.chemin, "r", encoding="utf-8-sig", newline="") as f:
+                lignes = list(csv.reader(f, delimiter=";"))
+        except FileNotFoundError:
+            return
+        self.rejets = [tuple(ligne) for ligne in lignes[1:] if ligne] + self.rejets
+
+    def noter(self, data):
+        """Rejets portes par un enregistrement (aucun pour une ligne valide)."""
+        source = data.get("source", "")
+        for ecarte in data.get("_lignes_ecartees", ()):
+            self.rejets.append((ecarte["ligne"], source, ecarte["reference"], ecarte["motif"]))
+        rejet = data.get("rejet")
+        if rejet:
+            reference = next((data[champ] for champ in CHAMPS_REFERENCE if data.get(champ)), "")
+            self.rejets.append((rejet["ligne"], source, reference, rejet["motif"]))
+
+    def fermer(self):
+        """Ecrit le rapport ; renvoie son chemin, ou None s'il n'y a aucun rejet."""
+        if not self.rejets:
+            try:
+                os.remove(self.chemin)
+            except FileNotFoundError:
+                pass
+            return None
+        dossier = os.path.dirname(self.chemin)
+        if dossier:
+            os.makedirs(dossier, exist_ok=True)
+        temporaire = self.chemin + ".tmp"
+        with open(temporaire, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(["ligne", "source", "reference", "motif"])
+            writer.writerows(self.rejets)
+        os.replace(temporaire, self.chemin)
+        return self.chemin
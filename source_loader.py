@@ -0,0 +1,175 @@
+import multiprocessing
+import os
+from collections import deque
+from multiprocessing.connection import wait
+
+from excel_loader import charger_donnees_excel, compter_lignes_excel, lister_feuilles
+from pipe_process import ProcessusPipe
+
+
+# Enregistrements envoyes par message : peu d'allers-retours, memoire bornee par envoi
+TAILLE_ENVOI = 500
+# Lecture en avance bornee : paquets gardes par source (au-dela, le lecteur
+# attend sur son envoi) et sources lancees au-dela de la source en cours, par lecteur
+PAQUETS_PAR_SOURCE = 4
+SOURCES_PAR_LECTEUR = 2
+
+
+def lister_sources(fichiers, toutes_feuilles=False):
+    """
+    Sources a lire, dans l'ordre : (fichier, feuille ou None). Avec
+    `toutes_feuilles`, chaque feuille d'un classeur est une source ; un
+    classeur au format long (feuille Lignes) et un CSV restent une seule source.
+    """
+    sources = []
+    for fichier in fichiers:
+        if not os.path.exists(fichier):
+            raise FileNotFoundError(f"Fichier introuvable : {fichier}")
+        feuilles = lister_feuilles(fichier) if toutes_feuilles else None
+        if feuilles:
+            sources.extend((fichier, feuille) for feuille in feuilles)
+        else:
+            sources.append((fichier, None))
+    return sources
+
+
+def libelle_source(fichier, feuille=None):
+    """Libelle d'une source, ecrit dans chaque enregistrement (champ `source`)."""
+    nom = os.path.basename(fichier)
+    return f"{nom} / {feuille}" if feuille is not None else nom
+
+
+def compter_sources(sources):
+    """Nombre approximatif de lignes de toutes les sources, ou None si une source ne le declare pas."""
+    total = 0
+    for fichier, feuille in sources:
+        nombre = compter_lignes_excel(fichier, feuille)
+        if nombre is None:
+            return None
+        total += nombre
+    return total
+
+
+def _lire_source(fichier, feuille):
+    libelle = libelle_source(fichier, feuille)
+    for record in charger_donnees_excel(fichier, streaming=True, feuille=feuille):
+        record["source"] = libelle
+        yield record
+
+
+def _worker_main(conn):
+    """Boucle d'un processus de lecture : recoit (numero, fichier, feuille), renvoie les enregistrements par paquets."""
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        numero, fichier, feuille = task
+        paquet = []
+        try:
+            for record in _lire_source(fichier, feuille):
+                paquet.append(record)
+                if len(paquet) >= TAILLE_ENVOI:
+                    conn.send(("paquet", numero, paquet))
+                    paquet = []
+            if paquet:
+                conn.send(("paquet", numero, paquet))
+            conn.send(("fin", numero, None))
+        except Exception as exc:
+            conn.send(("erreur", numero, f"{type(exc).__name__}: {exc}"))
+
+
+class _Lecteur(ProcessusPipe):
+    def __init__(self, ctx):
+        super().__init__(ctx, _worker_main)
+        self.numero = None
+
+    def submit(self, numero, fichier, feuille):
+        self.conn.send((numero, fichier, feuille))
+        self.numero = numero
+
+
+def charger_sources(fichiers, toutes_feuilles=False, workers=None):
+    """
+    Charge plusieurs classeurs (et/ou toutes leurs feuilles, voir lister_sources)
+    comme un seul flux d'enregistrements : les sources sont lues en parallele
+    dans des processus, les enregistrements sont rendus dans l'ordre des sources
+    puis des lignes. Chaque enregistrement porte sa source (`source` :
+    "classeur.xlsx" ou "classeur.xlsx / Feuille").
+
+    Memoire bornee : au plus PAQUETS_PAR_SOURCE paquets en attente par source
+    et SOURCES_PAR_LECTEUR sources lancees par lecteur en avance sur la source
+    en cours ; un lecteur en avance attend que son tour approche.
+
+    Une source illisible arrete le flux (ValueError) quand son tour arrive.
+    """
+    sources = lister_sources(fichiers, toutes_feuilles)
+    workers = min(max(1, workers or os.cpu_count() or 1), len(sources))
+    if workers <= 1:
+        for fichier, feuille in sources:
+            yield from _lire_source(fichier, feuille)
+        return
+
+    ctx = multiprocessing.get_context()
+    pool = [_Lecteur(ctx) for _ in range(workers)]
+    paquets = {numero: deque() for numero in range(len(sources))}
+    finies = set()
+    erreurs = {}
+    courante = 0
+    prochaine = 0
+
+    def lancer():
+        nonlocal prochaine
+        for lecteur in pool:
+            if prochaine >= min(len(sources), courante + SOURCES_PAR_LECTEUR * len(pool)):
+                return
+            if lecteur.numero is None:
+                lecteur.submit(prochaine, *sources[prochaine])
+                prochaine += 1
+
+    def recevoir(timeout):
+        # Source au plein de ses paquets : son lecteur n'est plus lu et attend sur son envoi
+        occupes = [
+            lecteur for lecteur in pool
+            if lecteur.numero is not None and len(paquets[lecteur.numero]) < PAQUETS_PAR_SOURCE
+        ]
+        prets = wait([lecteur.conn for lecteur in occupes], timeout=timeout) if occupes else []
+        for i, lecteur in enumerate(pool):
+            if lecteur not in occupes or lecteur.conn not in prets:
+                continue
+            try:
+                genre, numero, contenu = lecteur.conn.recv()
+            except EOFError:
+                genre, numero, contenu = "erreur", lecteur.numero, "Processus de lecture interrompu"
+                lecteur.stop(force=True)
+                lecteur = pool[i] = _Lecteur(ctx)
+            if genre == "paquet":
+                paquets[numero].append(contenu)
+                continue
+            if genre == "erreur":
+                erreurs[numero] = contenu
+            finies.add(numero)
+            lecteur.numero = None
+        lancer()
+
+    try:
+        lancer()
+        while courante < len(sources):
+            if paquets[courante]:
+                paquet = paquets[courante].popleft()
+                # Releve les envois prets sans attendre : les autres lecteurs ne restent pas bloques
+                recevoir(0)
+                yield from paquet
+            elif courante in finies:
+                if courante in erreurs:
+                    raise ValueError(f"{libelle_source(*sources[courante])} : {erreurs[courante]}")
+                del paquets[courante]
+                courante += 1
+                lancer()
+            else:
+                recevoir(None)
+    finally:
+        for lecteur in pool:
+            lecteur.stop(force=lecteur.numero is not None)
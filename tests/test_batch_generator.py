@@ -0,0 +1,28 @@
+import os
+import time
+
+from batch_generator import iterer_lot
+
+
+def _facture(reference, nb_lignes=1):
+    lignes = [
+        {
+            "numero": numero, "designation": "Prestation", "type_prestation": "", "unite": "j",
+            "quantite": 1.0, "prix_unitaire": 10.0, "montant": 10.0,
+        }
+        for numero in range(1, nb_lignes + 1)
+    ]
+    return {"numero_otfi": reference, "lignes": lignes, "total_ht": 10.0 * nb_lignes}
+
+
+def test_arret_en_cours_de_lot_sans_fichier_temporaire(tmp_path):
+    sortie = str(tmp_path)
+    # Facture longue a ecrire : son fichier temporaire existe quand le lot est arrete
+    resultats = iterer_lot([_facture("F1"), _facture("F2", nb_lignes=4000)], sortie, workers=2)
+    assert next(resultats)["erreur"] is None
+    limite = time.monotonic() + 60
+    while not any(nom.endswith(".tmp") for nom in os.listdir(sortie)) and time.monotonic() < limite:
+        time.sleep(0.005)
+    resultats.close()
+    assert [nom for nom in os.listdir(sortie) if nom.endswith(".tmp")] == []
+    assert os.listdir(sortie) == ["Facture_F1.docx"]
@@ -0,0 +1,78 @@
+import openpyxl
+
+from excel_loader import charger_donnees_excel
+from generate_facture import nom_facture
+from main import ecrire_template_excel
+from rejects_report import RapportRejets
+
+
+def test_template_exporte_sans_rejet(tmp_path):
+    chemin = str(tmp_path / "template_factures.xlsx")
+    ecrire_template_excel(chemin)
+    for streaming in (False, True):
+        records = list(charger_donnees_excel(chemin, streaming=streaming))
+        assert len(records) == 1
+        assert "rejet" not in records[0]
+        assert len(records[0]["lignes"]) == 2
+
+
+def test_meme_resultat_pandas_et_streaming_avec_cellules_vides(tmp_path):
+    chemin = str(tmp_path / "factures.xlsx")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["numero_otfi", "code_projet", "ligne1_designation", "ligne1_quantite", "ligne1_prix_unitaire", "somme_facture"])
+    for i in range(300):
+        # Reference et code projet numeriques, vides sur quelques lignes
+        ws.append([1000 + i if i % 97 else None, 7 if i % 50 else None, "Prestation", 2, 50, 100])
+    wb.save(chemin)
+    records_pandas = list(charger_donnees_excel(chemin, streaming=False))
+    records_streaming = list(charger_donnees_excel(chemin, streaming=True))
+    assert records_pandas == records_streaming
+    assert records_pandas[1]["numero_otfi"] == 1001
+    assert nom_facture(records_pandas[1]) == nom_facture(records_streaming[1]) == "Facture_1001.docx"
+
+
+def test_lignes_hors_ordre_rejetees_sans_interrompre(tmp_path):
+    chemin = str(tmp_path / "factures_long.xlsx")
+    wb = openpyxl.Workbook()
+    factures = wb.active
+    factures.title = "Factures"
+    factures.append(["numero_otfi", "somme_facture"])
+    for reference in ("A", "B", "C", "D"):
+        factures.append([reference, 10])
+    lignes = wb.create_sheet("Lignes")
+    lignes.append(["numero_otfi", "designation", "quantite", "prix_unitaire"])
+    for reference in ("A", "C", "B", "X", "D"):
+        lignes.append([reference, "Prestation", 1, 10])
+    wb.save(chemin)
+    records = list(charger_donnees_excel(chemin))
+    # Une facture par ligne de la feuille des factures, a sa ligne Excel
+    assert [(record["numero_otfi"], record["_ligne"]) for record in records] == [("A", 2), ("B", 3), ("C", 4), ("D", 5)]
+    assert [record.get("rejet") is None for record in records] == [True, True, False, True]
+    assert "hors de l'ordre" in records[2]["rejet"]["motif"]
+    # Lignes de C avant celles de B, X sans facture : groupes ecartes portes par la facture suivante
+    assert [(ecarte["ligne"], ecarte["reference"]) for ecarte in records[1]["_lignes_ecartees"]] == [(3, "C")]
+    assert [(ecarte["ligne"], ecarte["reference"]) for ecarte in records[3]["_lignes_ecartees"]] == [(5, "X")]
+    assert "introuvable" in records[3]["_lignes_ecartees"][0]["motif"]
+    assert records[3]["lignes"][0]["montant"] == 10.0
+
+    rapport = RapportRejets(str(tmp_path / "rejets.csv"))
+    for record in records:
+        rapport.noter(record)
+    assert [(ligne, reference) for ligne, _, reference, _ in rapport.rejets] == [(3, "C"), (4, "C"), (5, "X")]
+
+
+def test_reference_par_alias_de_colonne(tmp_path):
+    chemin = str(tmp_path / "alias.xlsx")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["CodeProjet", "CodeSousProjet", "Periode"])
+    ws.append(["P1", "S1", "T1"])
+    ws.append(["P2", "", "T2"])
+    ws.append(["", "", "T3"])
+    wb.save(chemin)
+    for streaming in (False, True):
+        records = list(charger_donnees_excel(chemin, streaming=streaming))
+        assert [record["code_projet"] for record in records] == ["P1", "P2", ""]
+        assert records[0].get("rejet") is None and records[1].get("rejet") is None
+        assert "reference manquante" in records[2]["rejet"]["motif"]
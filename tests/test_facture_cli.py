@@ -0,0 +1,38 @@
+import csv
+
+import openpyxl
+
+import facture_cli
+from checkpoint import PointReprise
+from excel_loader import charger_donnees_excel
+from rejects_report import RapportRejets, chemin_rejets
+
+
+def _lignes_rapport(chemin):
+    with open(chemin, "r", encoding="utf-8-sig", newline="") as f:
+        return [ligne[0] for ligne in list(csv.reader(f, delimiter=";"))[1:]]
+
+
+def test_reprise_garde_les_rejets_du_lot_interrompu(tmp_path):
+    entree = str(tmp_path / "factures.xlsx")
+    sortie = str(tmp_path / "sortie")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["numero_otfi", "periode"])
+    # Lignes 2 et 4 sans reference : rejetees
+    for reference, periode in (("", "T1"), ("F1", "T1"), ("", "T2"), ("F2", "T2")):
+        ws.append([reference, periode])
+    wb.save(entree)
+
+    # Lot interrompu apres la ligne 3 : rapport de la ligne 2 deja ecrit
+    records = list(charger_donnees_excel(entree, streaming=True))
+    rapport = RapportRejets(chemin_rejets(sortie))
+    rapport.noter(records[0])
+    rapport.fermer()
+    reprise = PointReprise(sortie, entree)
+    reprise.avancer(0, data=records[0])
+    reprise.avancer(1, data=records[1])
+    reprise.sauver()
+
+    facture_cli.main([entree, "-o", sortie, "--reprendre", "--workers", "1"])
+    assert _lignes_rapport(chemin_rejets(sortie)) == ["2", "4"]
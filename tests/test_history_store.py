@@ -0,0 +1,31 @@
+import json
+
+from history_store import JsonlHistoryStore, SqliteHistoryStore
+
+
+def _entree(numero):
+    return {"datetime": "2025-03-01 10:00:00", "file": f"Facture_{numero}.docx", "meta": {"numero_otfi": numero}}
+
+
+def _ouvrir(tmp_path):
+    journal = tmp_path / "history.jsonl"
+    ancien = tmp_path / "history.json"
+    legacy = JsonlHistoryStore(str(journal), legacy_path=str(ancien))
+    return SqliteHistoryStore(str(tmp_path / "history.sqlite3"), legacy_stores=[legacy])
+
+
+def test_import_ancien_historique(tmp_path):
+    (tmp_path / "history.json").write_text(json.dumps([_entree("A1"), _entree("A2")]), encoding="utf-8")
+    store = _ouvrir(tmp_path)
+    assert [entry["meta"]["numero_otfi"] for entry in store.entries()] == ["A1", "A2"]
+
+
+def test_tout_supprimer_puis_rouvrir(tmp_path):
+    (tmp_path / "history.json").write_text(json.dumps([_entree("A1"), _entree("A2")]), encoding="utf-8")
+    store = _ouvrir(tmp_path)
+    for entry in list(store.entries()):
+        store.remove(entry["id"])
+    store.conn.close()
+
+    store = _ouvrir(tmp_path)
+    assert store.count() == 0